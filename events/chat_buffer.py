@@ -0,0 +1,117 @@
+# events/chat_buffer.py
+import asyncio
+import json
+import uuid
+
+import redis
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from volleyball_app.redis_client import get_redis
+
+# Write-behind persistence for chat messages (off unless CHAT_WRITE_BEHIND is set).
+# ChatConsumer gives each message its uid and timestamp, appends it here and broadcasts it;
+# the rows are written with bulk_create every CHAT_WRITE_BEHIND_INTERVAL_MS or once
+# CHAT_WRITE_BEHIND_BATCH messages are waiting.
+#  * Redis stream (when REDIS_URL is configured): entries are only deleted after their rows
+#    are written, so a crashed process loses nothing; flush_chat_buffer replays leftovers.
+#  * without Redis: a per-process list, lost if the process dies before the next flush.
+# Rows are inserted with ignore_conflicts on uid, so writing an entry twice is harmless.
+WRITE_BEHIND = getattr(settings, 'CHAT_WRITE_BEHIND', False)
+FLUSH_INTERVAL = getattr(settings, 'CHAT_WRITE_BEHIND_INTERVAL_MS', 300) / 1000
+FLUSH_SIZE = getattr(settings, 'CHAT_WRITE_BEHIND_BATCH', 200)
+STREAM_KEY = 'chat:write-behind'
+
+_local_buffer = []
+_flusher = None  # This process's periodic flush task
+
+
+def new_record(event_id, user_id, message):
+    return {
+        'uid': str(uuid.uuid4()),
+        'event_id': int(event_id),
+        'user_id': user_id,
+        'message': message,
+        'timestamp': timezone.now().isoformat(),
+    }
+
+
+def append(record):
+    """Buffers one message and returns how many messages are waiting to be written."""
+    client = get_redis()
+    if client is not None:
+        try:
+            pipe = client.pipeline()
+            pipe.xadd(STREAM_KEY, {'record': json.dumps(record)})
+            pipe.xlen(STREAM_KEY)
+            return pipe.execute()[1]
+        except redis.RedisError as e:
+            print(f"[ERROR] Chat buffer append failed, keeping message {record['uid']} in process: {e}")
+    _local_buffer.append(record)
+    return len(_local_buffer)
+
+
+def write_records(records):
+    """bulk_create for buffered messages. Messages of events or users deleted meanwhile are dropped."""
+    ChatMessage = apps.get_model('events', 'ChatMessage')
+    Event = apps.get_model('events', 'Event')
+    CustomUser = apps.get_model('users', 'CustomUser')
+
+    event_ids = set(Event.objects.filter(id__in={r['event_id'] for r in records}).values_list('id', flat=True))
+    user_ids = set(CustomUser.objects.filter(id__in={r['user_id'] for r in records}).values_list('id', flat=True))
+    ChatMessage.objects.bulk_create([
+        ChatMessage(
+            uid=record['uid'], event_id=record['event_id'], user_id=record['user_id'],
+            message=record['message'], timestamp=parse_datetime(record['timestamp']),
+        )
+        for record in records
+        if record['event_id'] in event_ids and record['user_id'] in user_ids
+    ], ignore_conflicts=True)
+
+
+def flush():
+    """Writes everything buffered so far and returns the number of messages written."""
+    flushed = 0
+    while _local_buffer:
+        batch = _local_buffer[:FLUSH_SIZE]
+        write_records(batch)
+        del _local_buffer[:len(batch)]
+        flushed += len(batch)
+
+    client = get_redis()
+    if client is None:
+        return flushed
+    try:
+        while True:
+            entries = client.xrange(STREAM_KEY, count=FLUSH_SIZE)
+            if not entries:
+                break
+            write_records([json.loads(fields['record']) for _, fields in entries])
+            client.xdel(STREAM_KEY, *[entry_id for entry_id, _ in entries])
+            flushed += len(entries)
+    except redis.RedisError as e:
+        print(f"[ERROR] Chat buffer flush failed: {e}")
+    return flushed
+
+
+async def buffer_message(record):
+    """Called by ChatConsumer; keeps this process's flush loop running."""
+    global _flusher
+    loop = asyncio.get_running_loop()
+    if _flusher is None or _flusher.done() or _flusher.get_loop() is not loop:
+        _flusher = loop.create_task(_flush_loop())
+    waiting = await sync_to_async(append)(record)
+    if waiting >= FLUSH_SIZE:
+        await sync_to_async(flush)()
+
+
+async def _flush_loop():
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        try:
+            await sync_to_async(flush)()
+        except Exception as e:
+            print(f"[ERROR] Chat buffer flush failed: {e}")
@@ -0,0 +1,204 @@
+# events/chat_history.py
+import json
+import time
+from collections import OrderedDict
+
+import redis
+from django.apps import apps
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from volleyball_app.redis_client import get_redis
+
+# Hot tier for chat history: the newest CHAT_HOT_MESSAGES messages of every active room,
+# so joins and the first history pages never touch the ChatMessage table.
+#  * Redis: a capped stream per room plus a "warm" marker. A room is warmed from the
+#    database once (merged with whatever was appended meanwhile, under WATCH), then every
+#    new message is appended. Both keys expire after CHAT_HOT_TTL seconds without messages.
+#  * without REDIS_URL: a per-process list per room (single-process setups only), dropped
+#    after CHAT_HOT_TTL seconds without use and capped at LOCAL_MAX_ROOMS rooms.
+# A message can reach the tier twice (appended after a warm-up already read it from the
+# database), so records are deduplicated on uid when read. Rooms are forgotten when messages
+# are deleted with their event or author (see forget_rooms).
+# Pages older than the hot tier are read from the database by (-timestamp, -uid).
+HOT_SIZE = getattr(settings, 'CHAT_HOT_MESSAGES', 200)
+HOT_TTL = getattr(settings, 'CHAT_HOT_TTL', 6 * 60 * 60)
+ORDERING = ('-timestamp', '-uid')
+LOCAL_MAX_ROOMS = 1000
+
+_local_rooms = OrderedDict()  # event id -> [last used, records oldest first], least recently used first
+
+
+def _stream_key(event_id):
+    return f'chat:recent:{event_id}'
+
+
+def _warm_key(event_id):
+    return f'chat:recent:{event_id}:warm'
+
+
+def message_record(message, user=None):
+    """The JSON-ready form of a chat message, as kept in the hot tier."""
+    user = user or message.user
+    return {
+        'id': message.id,
+        'uid': str(message.uid),
+        'user': str(user),
+        'user_id': user.id,
+        'user_nickname': user.nickname,
+        'user_first_name': user.first_name,
+        'user_last_name': user.last_name,
+        'message': message.message,
+        'timestamp': message.timestamp if isinstance(message.timestamp, str) else message.timestamp.isoformat(),
+    }
+
+
+def _sort_key(record):
+    return parse_datetime(record['timestamp']), record['uid']
+
+
+def _load_from_db(event_id, position=None, limit=None):
+    """Records newest first, optionally only those before a (timestamp, uid) position."""
+    from .pagination import keyset_filter
+    ChatMessage = apps.get_model('events', 'ChatMessage')
+    queryset = ChatMessage.objects.filter(event_id=event_id).select_related('user').order_by(*ORDERING)
+    if position is not None:
+        queryset = queryset.filter(keyset_filter(ORDERING, position))
+    return [message_record(message) for message in queryset[:limit or HOT_SIZE]]
+
+
+def _local_room(event_id, load=True):
+    """The local tier of a room, oldest first; loaded from the database when `load` is set."""
+    now = time.monotonic()
+    while _local_rooms:
+        used, _ = next(iter(_local_rooms.values()))
+        if now - used <= HOT_TTL:
+            break
+        _local_rooms.popitem(last=False)
+
+    key = str(event_id)
+    room = _local_rooms.get(key)
+    if room is None:
+        if not load:
+            return None
+        room = _local_rooms[key] = [now, list(reversed(_load_from_db(event_id)))]
+        while len(_local_rooms) > LOCAL_MAX_ROOMS:
+            _local_rooms.popitem(last=False)
+    room[0] = now
+    _local_rooms.move_to_end(key)
+    return room[1]
+
+
+def _unique(records):
+    seen = set()
+    return [record for record in records if not (record['uid'] in seen or seen.add(record['uid']))]
+
+
+def remember(event_id, record):
+    """Appends a new message to the room's hot tier."""
+    client = get_redis()
+    if client is None:
+        records = _local_room(event_id, load=False)
+        if records is not None and all(cached['uid'] != record['uid'] for cached in records):
+            records.append(record)
+            del records[:-HOT_SIZE]
+        return
+    try:
+        pipe = client.pipeline()
+        pipe.xadd(_stream_key(event_id), {'record': json.dumps(record)}, maxlen=HOT_SIZE, approximate=False)
+        pipe.expire(_stream_key(event_id), HOT_TTL)
+        pipe.expire(_warm_key(event_id), HOT_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"[ERROR] Chat hot tier append failed for event {event_id}: {e}")
+
+
+def _warm(client, event_id):
+    key = _stream_key(event_id)
+    for _ in range(3):
+        with client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                appended = [json.loads(fields['record']) for _, fields in pipe.xrange(key)]
+                merged = {record['uid']: record for record in _load_from_db(event_id)}
+                merged.update((record['uid'], record) for record in appended)
+                records = sorted(merged.values(), key=_sort_key)[-HOT_SIZE:]
+
+                pipe.multi()
+                pipe.delete(key)
+                for record in records:
+                    pipe.xadd(key, {'record': json.dumps(record)})
+                pipe.expire(key, HOT_TTL)
+                pipe.set(_warm_key(event_id), 1, ex=HOT_TTL)
+                pipe.execute()
+                return list(reversed(records))
+            except redis.WatchError:
+                continue  # A message arrived while warming; merge again
+    return None
+
+
+def recent_records(event_id):
+    """
+    (records newest first, complete) for the room's hot tier, or None when it cannot be read.
+    `complete` is set when the tier is not full, i.e. holds every message of the room.
+    """
+    client = get_redis()
+    if client is None:
+        records = _local_room(event_id)
+        return list(reversed(records)), len(records) < HOT_SIZE
+    try:
+        if client.exists(_warm_key(event_id)):
+            records = [json.loads(fields['record']) for _, fields in client.xrevrange(_stream_key(event_id))]
+        else:
+            records = _warm(client, event_id)
+            if records is None:
+                return None
+    except redis.RedisError as e:
+        print(f"[ERROR] Chat hot tier read failed for event {event_id}: {e}")
+        return None
+    # Duplicates still take up room in the stream, so completeness goes by its length
+    return _unique(records), len(records) < HOT_SIZE
+
+
+def forget_rooms(event_ids):
+    """Drops the hot tier of these rooms; the next read reloads them from the database."""
+    event_ids = list(event_ids)
+    for event_id in event_ids:
+        _local_rooms.pop(str(event_id), None)
+    client = get_redis()
+    if client is None or not event_ids:
+        return
+    try:
+        client.delete(*[key for event_id in event_ids for key in (_warm_key(event_id), _stream_key(event_id))])
+    except redis.RedisError as e:
+        print(f"[ERROR] Chat hot tier eviction failed for events {event_ids}: {e}")
+
+
+def hot_page(event_id, position, page_size):
+    """
+    (records newest first, has_more) for the page before `position` (None for the newest page),
+    or None when the page reaches past the hot tier and has to come from the database.
+    `position` holds typed values (see pagination.coerce_position); comparing a naive
+    timestamp with the stored ones raises TypeError.
+    """
+    hot = recent_records(event_id)
+    if hot is None:
+        return None
+    records, complete = hot
+    if position is not None:
+        before = (position[0], str(position[1]))
+        records = [record for record in records if _sort_key(record) < before]
+    if len(records) > page_size:
+        return records[:page_size], True
+    if complete:
+        return records, False
+    return None
+
+
+def history_page(event_id, position, page_size):
+    """(records newest first, has_more): from the hot tier when possible, else from the database."""
+    page = hot_page(event_id, position, page_size)
+    if page is not None:
+        return page
+    records = _load_from_db(event_id, position, page_size + 1)
+    return records[:page_size], len(records) > page_size
@@ -1,9 +1,14 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
-from django.utils import timezone
+from django.conf import settings
 from asgiref.sync import sync_to_async
 from .serializers import ChatMessageSerializer
-from .views import notify_user_about_event
+from users.blocks import user_group_name
+from . import chat_buffer, chat_history, presence
+from .pagination import ChatMessageCursorPagination, coerce_position, decode_cursor, encode_cursor, position_of
+
+# Chat rooms one ws/live/ socket may be subscribed to at the same time
+LIVE_MAX_ROOMS = getattr(settings, 'LIVE_MAX_ROOMS', 20)
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -15,14 +20,23 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.event_id,
             self.channel_name
         )
+        # The viewer's block list is loaded once and then kept current by blocks.changed messages.
+        # Join the user group first, so no change between the load and the join is missed.
+        self.user_group = None
+        if self.scope['user'].is_authenticated:
+            self.user_group = user_group_name(self.scope['user'].id)
+            await self.channel_layer.group_add(self.user_group, self.channel_name)
+        self.blocked_user_ids = set(await self.load_blocked_user_ids())
         await self.accept()
+        await self.mark_present(self.event_id)
         
-        # Send old messages when a new user connects
-        messages = await self.get_old_messages()
-        for message in messages:
-            await self.send(text_data=json.dumps(message))
+        # Send the latest page of history in one frame when a new user connects
+        await self.send_history(self.event_id)
         
     async def disconnect(self, close_code):
+        await self.mark_absent(self.event_id)
+        if getattr(self, 'user_group', None):
+            await self.channel_layer.group_discard(self.user_group, self.channel_name)
         # Leave the chat room group
         await self.channel_layer.group_discard(
             self.event_id,
@@ -33,38 +47,68 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def receive(self, text_data):
         try:
             text_data_json = json.loads(text_data)
-            message = text_data_json.get('message')
-            user_id = self.scope['user'].id
-            
-            print(f'Received message: {message} from user {user_id}')
-            
-            if not message:
-                raise ValueError("Message content is empty or not provided")
-            
-            # Save the message to the database
-            await self.save_message(user_id, message)
-            await self.notify_users_about_event(user_id, message)
-            
-            # Broadcast message to the chat room group
-            await self.channel_layer.group_send(
-                self.event_id,
-                {
-                    'type': 'chat_message',
-                    'message': message,
-                    'user_id': user_id,
-                    'user_nickname': self.scope['user'].nickname,
-                    'user_first_name': self.scope['user'].first_name,
-                    'user_last_name': self.scope['user'].last_name,
-                    'timestamp': timezone.now().isoformat()
-                }
-            )
-            
-            print(f'Sent message: {message} by user {user_id} to group {self.event_id}')
+            # Clients send {"type": "heartbeat"} while the room is open; any message counts too
+            await self.mark_present(self.event_id)
+            if text_data_json.get('type') == 'heartbeat':
+                return
+            # {"type": "load_earlier", "before": <cursor from the last history frame>}
+            if text_data_json.get('type') == 'load_earlier':
+                await self.send_history(self.event_id, text_data_json.get('before'))
+                return
+            await self.post_message(self.event_id, text_data_json.get('message'))
         except json.JSONDecodeError as e:
             print(f'JSON decode error: {e}')
         except Exception as e:
             print(f'Error in receive method: {e}')
+
+    async def post_message(self, event_id, message):
+        """Stores, broadcasts and pushes one message from this socket's user to a room."""
+        user_id = self.scope['user'].id
+        
+        print(f'Received message: {message} from user {user_id}')
+        
+        if not message:
+            raise ValueError("Message content is empty or not provided")
+        
+        # Save the message to the database, or hand it to the write-behind buffer
+        record = chat_buffer.new_record(event_id, user_id, message)
+        if chat_buffer.WRITE_BEHIND:
+            await chat_buffer.buffer_message(record)
+        else:
+            await self.save_message(record)
+        await self.remember_message(event_id, record)
+        
+        # Broadcast message to the chat room group
+        await self.channel_layer.group_send(
+            str(event_id),
+            {
+                'type': 'chat_message',
+                'event_id': int(event_id),
+                'message': message,
+                'user_id': user_id,
+                'user_nickname': self.scope['user'].nickname,
+                'user_first_name': self.scope['user'].first_name,
+                'user_last_name': self.scope['user'].last_name,
+                'timestamp': record['timestamp']
+            }
+        )
         
+        print(f'Sent message: {message} by user {user_id} to group {event_id}')
+
+        # Pushes for everyone not in the room are worked out by a Celery task
+        await self.notify_users_about_event(event_id, user_id, message)
+
+    async def send_history(self, event_id, before=None):
+        try:
+            messages, earlier = await self.get_old_messages(event_id, before)
+        except (ValueError, KeyError, TypeError):
+            await self.send(text_data=json.dumps(self.room_frame(event_id, {'type': 'error', 'message': 'Invalid cursor'})))
+            return
+        await self.send(text_data=json.dumps(self.room_frame(event_id, {'type': 'history', 'messages': messages, 'before': earlier})))
+
+    def room_frame(self, event_id, frame):
+        # This socket carries a single room, so frames need no room id
+        return frame
 
     async def chat_message(self, event):
         message = event.get('message')
@@ -75,88 +119,212 @@ class ChatConsumer(AsyncWebsocketConsumer):
         timestamp = event.get('timestamp')
         
         # Check if the message sender is blocked by the receiver
-        if await self.is_blocked_by_user(user_id):
+        if user_id in self.blocked_user_ids:
             user_nickname = "用戶已被封鎖"
             message = "用戶已被封鎖"
 
         # Send message to WebSocket
-        await self.send(text_data=json.dumps({
+        await self.send(text_data=json.dumps(self.room_frame(event['event_id'], {
             'message': message,
             'user_id': user_id,
             'user_nickname': user_nickname,
             'user_first_name': user_first_name,
             'user_last_name': user_last_name,
             'timestamp': timestamp
-        }))
+        })))
     
     @sync_to_async
-    def is_blocked_by_user(self, sender_id):
-        """Check if the connected user has blocked the sender."""
-        from users.models import Block
-        return Block.objects.filter(blocker=self.scope['user'], blocked_id=sender_id).exists()
+    def mark_present(self, event_id):
+        if self.scope['user'].is_authenticated:
+            presence.mark_present(event_id, self.scope['user'].id, self.channel_name)
+
+    @sync_to_async
+    def mark_absent(self, event_id):
+        if self.scope['user'].is_authenticated:
+            presence.mark_absent(event_id, self.scope['user'].id, self.channel_name)
+
+    async def blocks_changed(self, event):
+        # Sent by BlockUserView / UnblockUserView to the user's own connections
+        if event['blocked']:
+            self.blocked_user_ids.add(event['blocked_id'])
+        else:
+            self.blocked_user_ids.discard(event['blocked_id'])
+
+    async def notification_created(self, event):
+        # Also sent to the user's group; only ws/live/ sockets show notifications in-app
+        pass
+
+    @sync_to_async
+    def load_blocked_user_ids(self):
+        from users.blocks import get_blocked_user_ids
+        return get_blocked_user_ids(self.scope['user'].id)
 
     @sync_to_async
-    def get_old_messages(self):
+    def get_old_messages(self, event_id, before=None):
+        """
+        One page of history, oldest first, plus the cursor for the page before it
+        (None when this page reaches the first message). Recent pages come from the
+        room's hot tier; only older ones hit the database.
+        """
+        ordering = ChatMessageCursorPagination.ordering
+        page_size = ChatMessageCursorPagination.page_size
+
+        # Users blocked by the current user, loaded at connect
+        blocked_users = self.blocked_user_ids
+
         from .models import ChatMessage
-        from users.models import Block  # Import Block model to check blocked users
 
-        # Get the list of users blocked by the current user
-        blocked_users = Block.objects.filter(blocker=self.scope['user']).values_list('blocked', flat=True)
-        
-        # Fetch all messages for this event
-        queryset = ChatMessage.objects.filter(event_id=self.event_id).order_by('timestamp')
+        position = coerce_position(ChatMessage, ordering, decode_cursor(before, ordering)[0]) if before else None
+        page, has_more = chat_history.history_page(event_id, position, page_size)
+        earlier = encode_cursor(position_of(page[-1], ordering)) if has_more else None
 
         # Modify messages where the sender is in the blocked list
         messages = []
-        for message in queryset:
-            if message.user_id in blocked_users:
+        for message in reversed(page):
+            if message['user_id'] in blocked_users:
                 # Replace content for blocked users
                 messages.append({
-                    'user_id': message.user_id,
+                    'user_id': message['user_id'],
                     'user_nickname': "用戶已被封鎖",
                     'message': "用戶已被封鎖",
-                    'timestamp': message.timestamp.isoformat(),
+                    'timestamp': message['timestamp'],
                 })
             else:
                 # Otherwise, display the actual message content
                 messages.append({
-                    'user_id': message.user_id,
-                    'user_nickname': message.user.nickname,  # Assuming nickname field
-                    'message': message.message,
-                    'timestamp': message.timestamp.isoformat(),
+                    'user_id': message['user_id'],
+                    'user_nickname': message['user_nickname'],
+                    'message': message['message'],
+                    'timestamp': message['timestamp'],
                 })
 
-        return messages
+        return messages, earlier
 
     @sync_to_async
-    def save_message(self, user_id, message):
+    def save_message(self, record):
         from .models import ChatMessage  # Import model inside the method
         # Create a new chat message entry
-        ChatMessage.objects.create(
-            event_id=self.event_id,
-            user_id=user_id,
-            message=message,
-            timestamp=timezone.now()
-        )
+        record['id'] = ChatMessage.objects.create(
+            uid=record['uid'],
+            event_id=record['event_id'],
+            user_id=record['user_id'],
+            message=record['message'],
+            timestamp=record['timestamp']
+        ).id
 
     @sync_to_async
-    def notify_users_about_event(self, sender_id, message):
-        from .models import Event, Registration  # Import models inside the method
-        from users.models import Block
-        # Fetch all users from the event
-        registrations = Registration.objects.filter(event_id=self.event_id)
-        users = [registration.user for registration in registrations]
-        
-        # Fetch the creator of the event
-        event = Event.objects.get(id=self.event_id)
-        creator = event.created_by
-        
-        # Add the creator to the list if not already included
-        if creator not in users:
-            users.append(creator)
-        
-        # Notify each user except the sender
-        for user in users:
-            if user.id != sender_id and user.is_active:
-                if not Block.objects.filter(blocker=user, blocked_id=sender_id).exists():
-                    notify_user_about_event(user, self.event_id, f"{event.name} - 新的聊天室通知", message)
+    def remember_message(self, event_id, record):
+        user = self.scope['user']
+        chat_history.remember(event_id, {
+            'id': record.get('id'),
+            'uid': record['uid'],
+            'user': str(user),
+            'user_id': user.id,
+            'user_nickname': user.nickname,
+            'user_first_name': user.first_name,
+            'user_last_name': user.last_name,
+            'message': record['message'],
+            'timestamp': record['timestamp'],
+        })
+
+    @sync_to_async
+    def notify_users_about_event(self, event_id, sender_id, message):
+        from notifications.tasks import send_chat_notifications
+        try:
+            # Runs after the broadcast: fail fast instead of waiting out broker retries
+            send_chat_notifications.apply_async((int(event_id), sender_id, message), retry=False)
+        except Exception as e:
+            print(f'Could not queue chat notifications for event {event_id}: {e}')
+
+
+class LiveConsumer(ChatConsumer):
+    """
+    One authenticated socket per device (ws/live/) for all of the user's open chat rooms
+    and their in-app notifications. Client frames:
+        {"type": "subscribe", "event_id": 1}       joins the room and answers with its history
+        {"type": "unsubscribe", "event_id": 1}
+        {"type": "message", "event_id": 1, "message": "..."}
+        {"type": "load_earlier", "event_id": 1, "before": "<cursor>"}
+        {"type": "heartbeat"}                      keeps the user present in every subscribed room
+    Room frames are the ChatConsumer frames plus "event_id" (chat messages have type "message");
+    notifications arrive as {"type": "notification", "notification": {...}}.
+    """
+
+    async def connect(self):
+        if not self.scope['user'].is_authenticated:
+            await self.close()
+            return
+        self.rooms = set()
+        self.user_group = user_group_name(self.scope['user'].id)
+        await self.channel_layer.group_add(self.user_group, self.channel_name)
+        self.blocked_user_ids = set(await self.load_blocked_user_ids())
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        for event_id in getattr(self, 'rooms', ()):
+            await self.mark_absent(event_id)
+            await self.channel_layer.group_discard(str(event_id), self.channel_name)
+        if getattr(self, 'user_group', None):
+            await self.channel_layer.group_discard(self.user_group, self.channel_name)
+
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+            kind = data.get('type')
+            if kind == 'heartbeat':
+                for event_id in self.rooms:
+                    await self.mark_present(event_id)
+                return
+            try:
+                event_id = int(data['event_id'])
+            except (KeyError, TypeError, ValueError):
+                await self.send(text_data=json.dumps({'type': 'error', 'message': 'event_id is required'}))
+                return
+
+            if kind == 'subscribe':
+                await self.subscribe(event_id)
+            elif kind == 'unsubscribe':
+                await self.unsubscribe(event_id)
+            elif event_id not in self.rooms:
+                await self.send(text_data=json.dumps(self.room_frame(event_id, {'type': 'error', 'message': 'Not subscribed'})))
+            elif kind == 'load_earlier':
+                await self.mark_present(event_id)
+                await self.send_history(event_id, data.get('before'))
+            elif kind == 'message':
+                await self.mark_present(event_id)
+                await self.post_message(event_id, data.get('message'))
+        except json.JSONDecodeError as e:
+            print(f'JSON decode error: {e}')
+        except Exception as e:
+            print(f'Error in live receive: {e}')
+
+    async def subscribe(self, event_id):
+        if event_id not in self.rooms:
+            if len(self.rooms) >= LIVE_MAX_ROOMS:
+                await self.send(text_data=json.dumps(self.room_frame(event_id, {'type': 'error', 'message': 'Too many rooms'})))
+                return
+            if not await self.event_exists(event_id):
+                await self.send(text_data=json.dumps(self.room_frame(event_id, {'type': 'error', 'message': 'Event not found'})))
+                return
+            await self.channel_layer.group_add(str(event_id), self.channel_name)
+            self.rooms.add(event_id)
+        await self.mark_present(event_id)
+        await self.send_history(event_id)
+
+    async def unsubscribe(self, event_id):
+        if event_id in self.rooms:
+            self.rooms.discard(event_id)
+            await self.mark_absent(event_id)
+            await self.channel_layer.group_discard(str(event_id), self.channel_name)
+
+    def room_frame(self, event_id, frame):
+        return {'type': 'message', **frame, 'event_id': int(event_id)}
+
+    async def notification_created(self, event):
+        # Sent to the user's group by the notification outbox drainer
+        await self.send(text_data=json.dumps({'type': 'notification', 'notification': event['notification']}))
+
+    @sync_to_async
+    def event_exists(self, event_id):
+        from .models import Event
+        return Event.objects.filter(id=event_id).exists()
@@ -0,0 +1,82 @@
+# events/filters.py
+import datetime
+import math
+
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Event
+
+# Upper bound for ?starts_within= (hours); a year covers every sensible "starting soon" window
+MAX_STARTS_WITHIN_HOURS = 24 * 366
+
+
+def _multi_value(request, name, choices):
+    """Accepts both ?city=a&city=b and ?city=a,b. Unknown values are rejected."""
+    values = []
+    for raw in request.query_params.getlist(name):
+        values.extend(value.strip() for value in raw.split(',') if value.strip())
+    valid = {key for key, _ in choices}
+    unknown = [value for value in values if value not in valid]
+    if unknown:
+        raise ValidationError({name: f"Unknown value(s): {', '.join(unknown)}"})
+    return values
+
+
+def _date_value(request, name):
+    raw = request.query_params.get(name)
+    if not raw:
+        return None
+    try:
+        return datetime.date.fromisoformat(raw)
+    except ValueError:
+        raise ValidationError({name: "Use the YYYY-MM-DD format."})
+
+
+class EventFilterBackend(BaseFilterBackend):
+    """
+    Server-side filters for the event feeds, each backed by one of the
+    (column, date, start_time, id) indexes declared on Event:
+
+        ?city=taipei,new_taipei   ?net_type=men_net_mixed   ?status=open
+        ?date_from=2025-01-01     ?date_to=2025-01-07       ?has_spots=true
+        ?starts_within=2          (hours from now, answered by the starts_at index)
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        cities = _multi_value(request, 'city', Event.CITY_CHOICES)
+        if cities:
+            queryset = queryset.filter(city__in=cities)
+
+        net_types = _multi_value(request, 'net_type', Event.NET_TYPE_CHOICES)
+        if net_types:
+            queryset = queryset.filter(net_type__in=net_types)
+
+        statuses = _multi_value(request, 'status', Event.STATUS_CHOICES)
+        if statuses:
+            queryset = queryset.filter(status__in=statuses)
+
+        date_from = _date_value(request, 'date_from')
+        if date_from:
+            queryset = queryset.filter(date__gte=date_from)
+
+        date_to = _date_value(request, 'date_to')
+        if date_to:
+            queryset = queryset.filter(date__lte=date_to)
+
+        starts_within = request.query_params.get('starts_within')
+        if starts_within:
+            try:
+                hours = float(starts_within)
+            except ValueError:
+                raise ValidationError({'starts_within': "Give the number of hours."})
+            if not math.isfinite(hours) or not 0 < hours <= MAX_STARTS_WITHIN_HOURS:
+                raise ValidationError({'starts_within': f"Give a number of hours above 0 and up to {MAX_STARTS_WITHIN_HOURS}."})
+            now = timezone.now()
+            queryset = queryset.filter(starts_at__gte=now, starts_at__lte=now + datetime.timedelta(hours=hours))
+
+        if request.query_params.get('has_spots', '').lower() in ('1', 'true', 'yes'):
+            queryset = queryset.filter(spots_left__gt=0)
+
+        return queryset
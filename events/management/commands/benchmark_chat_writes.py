@@ -0,0 +1,66 @@
+import datetime
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from events import chat_buffer
+from events.models import ChatMessage, Event
+
+CustomUser = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares writing chat messages one INSERT at a time (the default ChatConsumer path) with "
+        "the write-behind path (buffer + bulk_create). Everything the benchmark creates is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000)
+        parser.add_argument('--batch', type=int, default=chat_buffer.FLUSH_SIZE, help="messages per bulk_create")
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        user = CustomUser.objects.create(username=f'bench-chat-{tag}', nickname='bench chat')
+        event = Event.objects.create(
+            name=f'chat benchmark {tag}', location='bench', date=timezone.localdate() + datetime.timedelta(days=30),
+            start_time=datetime.time(19), end_time=datetime.time(21), cost=0, spots_left=12,
+            created_by=user, status='open',
+        )
+        count = options['messages']
+
+        try:
+            records = [chat_buffer.new_record(event.id, user.id, f'message {i}') for i in range(count)]
+            started = time.perf_counter()
+            for record in records:
+                ChatMessage.objects.create(
+                    uid=record['uid'], event_id=event.id, user_id=user.id,
+                    message=record['message'], timestamp=record['timestamp'],
+                )
+            single = time.perf_counter() - started
+
+            records = [chat_buffer.new_record(event.id, user.id, f'message {i}') for i in range(count)]
+            started = time.perf_counter()
+            for start in range(0, count, options['batch']):
+                chat_buffer.write_records(records[start:start + options['batch']])
+            batched = time.perf_counter() - started
+
+            # Replaying the same entries must not duplicate anything
+            chat_buffer.write_records(records[:options['batch']])
+            stored = ChatMessage.objects.filter(event=event).count()
+        finally:
+            event.delete()
+            user.delete()
+
+        self.stdout.write(f"per-message INSERT: {count} messages in {single:.2f}s ({count / single:.0f} msg/s)")
+        self.stdout.write(
+            f"write-behind bulk_create (batch {options['batch']}): {count} messages in {batched:.2f}s "
+            f"({count / batched:.0f} msg/s), {single / batched:.1f}x faster"
+        )
+        if stored != 2 * count:
+            self.stdout.write(self.style.ERROR(f"expected {2 * count} stored messages, found {stored}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Replay wrote no duplicates."))
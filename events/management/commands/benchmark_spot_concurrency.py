@@ -0,0 +1,116 @@
+import datetime
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Sum
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from events.models import Event, Registration
+from events.views import ApproveRegistrationAPIView, UnregisterEventAPIView
+
+CustomUser = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Fires parallel approvals (and optionally unregistrations) at one event and checks that "
+        "spots are never oversold. Needs a database with row locks (PostgreSQL), not SQLite. "
+        "Everything the benchmark creates is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spots', type=int, default=12)
+        parser.add_argument('--registrations', type=int, default=60)
+        parser.add_argument('--people', type=int, default=1, help="number_of_people of every registration")
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--unregister', type=int, default=0, help="approved users that unregister concurrently")
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            raise CommandError("SQLite serializes all writers; run this against PostgreSQL.")
+
+        tag = uuid.uuid4().hex[:8]
+        host = CustomUser.objects.create(username=f'bench-host-{tag}', nickname='bench host')
+        players = [
+            CustomUser.objects.create(username=f'bench-{tag}-{i}', nickname=f'bench {i}')
+            for i in range(options['registrations'])
+        ]
+        event = Event.objects.create(
+            name=f'spot benchmark {tag}', location='bench', date=timezone.localdate() + datetime.timedelta(days=30),
+            start_time=datetime.time(19), end_time=datetime.time(21), cost=0, spots_left=options['spots'],
+            created_by=host, status='open',
+        )
+        registrations = [
+            Registration.objects.create(event=event, user=player, number_of_people=options['people'])
+            for player in players
+        ]
+
+        try:
+            elapsed, outcomes = self.run_approvals(event, host, registrations, options)
+            self.report(event, options, elapsed, outcomes)
+        finally:
+            event.delete()
+            CustomUser.objects.filter(id__in=[host.id] + [player.id for player in players]).delete()
+
+    def run_approvals(self, event, host, registrations, options):
+        factory = APIRequestFactory()
+        approve = ApproveRegistrationAPIView.as_view()
+        unregister = UnregisterEventAPIView.as_view()
+        unregister_ids = {registration.id for registration in registrations[:options['unregister']]}
+        # Every registration is approved twice, so double approvals are exercised as well
+        jobs = registrations * 2
+
+        def run(registration):
+            try:
+                request = factory.post(f'/api/approve/{registration.id}/')
+                force_authenticate(request, user=host)
+                response = approve(request, registration_id=registration.id)
+                # Let a few approved users drop out while other approvals are still running
+                if response.status_code == 200 and registration.id in unregister_ids:
+                    request = factory.post(f'/api/unregister/{event.id}/')
+                    force_authenticate(request, user=registration.user)
+                    unregister(request, event_id=event.id)
+                    return 'approved+unregistered'
+                return 'approved' if response.status_code == 200 else 'rejected'
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            outcomes = list(pool.map(run, jobs))
+        return time.perf_counter() - started, outcomes
+
+    def report(self, event, options, elapsed, outcomes):
+        event.refresh_from_db()
+        approved = Registration.objects.filter(event=event, is_approved=True)
+        approved_heads = approved.aggregate(total=Sum('number_of_people'))['total'] or 0
+        pending_heads = Registration.objects.filter(event=event, is_approved=False).aggregate(total=Sum('number_of_people'))['total'] or 0
+
+        self.stdout.write(
+            f"{len(outcomes)} requests in {elapsed:.2f}s ({len(outcomes) / elapsed:.0f} req/s): "
+            f"{outcomes.count('approved') + outcomes.count('approved+unregistered')} approved, "
+            f"{outcomes.count('approved+unregistered')} unregistered afterwards, {outcomes.count('rejected')} rejected"
+        )
+        self.stdout.write(f"spots_left={event.spots_left} status={event.status} approved_heads={approved_heads}")
+
+        failures = []
+        if event.spots_left < 0:
+            failures.append("spots_left went negative")
+        if event.spots_left + approved_heads != options['spots']:
+            failures.append(f"spots_left + approved heads = {event.spots_left + approved_heads}, expected {options['spots']}")
+        if (event.approved_head_count, event.pending_head_count) != (approved_heads, pending_heads):
+            failures.append(
+                f"head counts ({event.approved_head_count}, {event.pending_head_count}) "
+                f"do not match registrations ({approved_heads}, {pending_heads})"
+            )
+        if (event.spots_left == 0) != (event.status == 'waitlist'):
+            failures.append(f"status {event.status!r} does not match spots_left={event.spots_left}")
+
+        if failures:
+            raise CommandError("Invariants violated: " + "; ".join(failures))
+        self.stdout.write(self.style.SUCCESS("All invariants hold."))
@@ -0,0 +1,114 @@
+import datetime
+import re
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from events.models import ChatMessage, Event, Registration
+from notifications.models import Notification, NotificationBody, ScheduledReminder
+
+CustomUser = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds users, events, registrations, chat messages, notifications and reminders inside a transaction that is "
+        "rolled back, runs EXPLAIN on the hot lookups and fails if any of them scans a table sequentially."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--events', type=int, default=200)
+        parser.add_argument('--per-event', type=int, default=20, help="registrations, chat messages and legacy reminders per event")
+        parser.add_argument('--per-user', type=int, default=100, help="notifications per user")
+
+    def handle(self, *args, **options):
+        failures = []
+        try:
+            with transaction.atomic():
+                user, event, task_id = self.seed(options)
+                for label, queryset in self.lookups(user, event, task_id):
+                    plan = queryset.explain()
+                    if self.is_sequential_scan(plan):
+                        failures.append(label)
+                        self.stdout.write(self.style.ERROR(f"SEQ SCAN  {label}"))
+                    else:
+                        self.stdout.write(self.style.SUCCESS(f"index     {label}"))
+                    if options['verbosity'] > 1:
+                        self.stdout.write(plan)
+                raise Rollback
+        except Rollback:
+            pass
+
+        if failures:
+            raise CommandError(f"{len(failures)} lookups fall back to a sequential scan: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS("All lookups use an index."))
+
+    def seed(self, options):
+        tag = uuid.uuid4().hex[:8]
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f'plan-{tag}-{i}', nickname=f'plan {i}') for i in range(options['users'])
+        ])
+        events = Event.objects.bulk_create([
+            Event(
+                name=f'plan {i}', location='plan', date=datetime.date(2030, 1, 1) + datetime.timedelta(days=i % 365),
+                start_time=datetime.time(19), end_time=datetime.time(21), cost=0, spots_left=12,
+                created_by=users[i % len(users)], status='open',
+            )
+            for i in range(options['events'])
+        ])
+        Registration.objects.bulk_create([
+            Registration(event=event, user=users[(e + j) % len(users)], number_of_people=1, is_approved=j % 3 != 0)
+            for e, event in enumerate(events)
+            for j in range(min(options['per_event'], len(users)))
+        ])
+        ChatMessage.objects.bulk_create([
+            ChatMessage(event=event, user=users[(e + j) % len(users)], message=f'plan {j}')
+            for e, event in enumerate(events)
+            for j in range(options['per_event'])
+        ], batch_size=5000)
+        body = NotificationBody.objects.create(title='plan', message='plan')
+        Notification.objects.bulk_create([
+            Notification(user=user, body=body, event_id=events[j % len(events)].id, is_read=j % 4 != 0)
+            for user in users
+            for j in range(options['per_user'])
+        ], batch_size=5000)
+        ScheduledReminder.objects.bulk_create([
+            ScheduledReminder(event_id=event.id, task_id=f'{tag}-{event.id}-{j}')
+            for event in events
+            for j in range(options['per_event'])
+        ])
+
+        if connection.vendor == 'postgresql':
+            # Planner statistics for the freshly seeded rows
+            with connection.cursor() as cursor:
+                for model in (CustomUser, Event, Registration, ChatMessage, Notification, ScheduledReminder):
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+        event = events[len(events) // 2]
+        return event.created_by, event, f'{tag}-{event.id}-0'
+
+    def lookups(self, user, event, task_id):
+        return [
+            ("inbox page", Notification.objects.filter(user=user).order_by('-timestamp', '-id')[:21]),
+            ("unread notifications", Notification.objects.filter(user=user, is_read=False)),
+            ("approved registrations", Registration.objects.filter(event=event, is_approved=True)),
+            ("pending approvals of a host", Registration.objects.filter(event__created_by=user, is_approved=False)),
+            ("chat history page", ChatMessage.objects.filter(event=event).order_by('-timestamp', '-uid')[:51]),
+            ("legacy reminders by event", ScheduledReminder.objects.filter(event_id=event.id)),
+            ("legacy reminder by task", ScheduledReminder.objects.filter(task_id=task_id)),
+        ]
+
+    def is_sequential_scan(self, plan):
+        # Any table of the plan counts, including the joined ones
+        if connection.vendor == 'postgresql':
+            return 'Seq Scan on' in plan
+        if connection.vendor == 'sqlite':
+            return re.search(r'\bSCAN \w+\b(?! USING (COVERING )?INDEX)', plan) is not None
+        raise CommandError(f"Plan inspection is not implemented for {connection.vendor}.")
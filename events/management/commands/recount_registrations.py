@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from events.models import Event
+
+
+class Command(BaseCommand):
+    help = "Recomputes Event.approved_head_count / pending_head_count from the registrations."
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_ids', nargs='*', type=int, help="Only repair these events (default: all)")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Events updated per transaction")
+
+    def handle(self, *args, **options):
+        queryset = Event.objects.all()
+        if options['event_ids']:
+            queryset = queryset.filter(id__in=options['event_ids'])
+
+        batch_size = options['batch_size']
+        last_id = 0
+        repaired = 0
+        # Walk the events by primary key so each UPDATE only locks one batch of rows
+        while True:
+            ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                repaired += Event.recount_head_counts(Event.objects.filter(id__in=ids))
+            last_id = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Recounted registrations for {repaired} events."))
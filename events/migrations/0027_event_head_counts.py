@@ -0,0 +1,39 @@
+# Generated by Django 4.2.14 on 2026-10-18 20:21
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_head_counts(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    Registration = apps.get_model('events', 'Registration')
+
+    def total(is_approved):
+        registrations = Registration.objects.filter(event=OuterRef('pk'), is_approved=is_approved)
+        return Coalesce(Subquery(
+            registrations.values('event').annotate(total=Sum('number_of_people')).values('total')
+        ), 0)
+
+    Event.objects.update(approved_head_count=total(True), pending_head_count=total(False))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0026_alter_event_city'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='approved_head_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='pending_head_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_head_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.14 on 2026-10-18 20:24
+
+import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_starts_at_ends_at(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    batch_size = 1000
+    last_id = 0
+    while True:
+        events = list(
+            Event.objects.filter(id__gt=last_id).order_by('id')
+            .only('id', 'date', 'start_time', 'end_time', 'is_overnight')[:batch_size]
+        )
+        if not events:
+            break
+        for event in events:
+            event.starts_at = timezone.make_aware(datetime.datetime.combine(event.date, event.start_time))
+            end_date = event.date + datetime.timedelta(days=1) if event.is_overnight else event.date
+            event.ends_at = timezone.make_aware(datetime.datetime.combine(end_date, event.end_time))
+        Event.objects.bulk_update(events, ['starts_at', 'ends_at'])
+        last_id = events[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0028_event_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='ends_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='starts_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        # Fill the columns before the indexes exist, so the bulk updates do not maintain them
+        migrations.RunPython(backfill_starts_at_ends_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['starts_at'], name='event_starts_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['status', 'starts_at'], name='event_status_starts_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['status', 'ends_at'], name='event_status_ends_at_idx'),
+        ),
+    ]
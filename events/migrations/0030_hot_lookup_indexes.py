@@ -0,0 +1,21 @@
+# Generated by Django 4.2.14 on 2026-10-18 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0029_event_starts_at_ends_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='registration',
+            index=models.Index(fields=['event', 'is_approved'], name='registration_approved_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registration',
+            index=models.Index(condition=models.Q(('is_approved', False)), fields=['event'], name='registration_pending_idx'),
+        ),
+    ]
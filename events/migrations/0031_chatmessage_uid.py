@@ -0,0 +1,24 @@
+# Generated by Django 4.2.14 on 2026-10-18 20:45
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0030_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='uid',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.14 on 2026-10-18 20:45
+
+import uuid
+
+from django.db import migrations
+
+
+def populate_uids(apps, schema_editor):
+    ChatMessage = apps.get_model('events', 'ChatMessage')
+    batch_size = 2000
+    while True:
+        batch = list(ChatMessage.objects.filter(uid__isnull=True).only('id')[:batch_size])
+        if not batch:
+            break
+        for message in batch:
+            message.uid = uuid.uuid4()
+        ChatMessage.objects.bulk_update(batch, ['uid'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0031_chatmessage_uid'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_uids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.14 on 2026-10-18 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0033_alter_chatmessage_uid'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['event', '-timestamp', '-uid'], name='chatmessage_history_idx'),
+        ),
+    ]
@@ -1,11 +1,17 @@
 # events/models.py
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.utils import timezone
 import pytz
 import datetime
+import uuid
 from django.conf import settings
 from notifications.tasks import schedule_reminders, cancel_old_notifications
+from . import chat_history
 from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.utils.timezone import make_aware, get_current_timezone
 from django.conf import settings
@@ -70,13 +76,107 @@ class Event(models.Model):
     status = models.CharField(max_length=20,choices=STATUS_CHOICES,default=STATUS_CHOICES[0])
     cancellation_message = models.TextField(blank=True, null=True)  # Add this field
     city = models.CharField(max_length=50, choices=CITY_CHOICES, default='unspecified')
+    # Denormalized number_of_people totals of approved / pending registrations.
+    # Only ever changed through adjust_head_counts() and recount_head_counts().
+    approved_head_count = models.IntegerField(default=0)
+    pending_head_count = models.IntegerField(default=0)
+    # date/start_time/end_time/is_overnight as absolute instants, kept in sync by save()
+    starts_at = models.DateTimeField(null=True, editable=False)
+    ends_at = models.DateTimeField(null=True, editable=False)
+
+    HEAD_COUNT_FIELDS = ('approved_head_count', 'pending_head_count')
+    SCHEDULE_FIELDS = ('date', 'start_time', 'end_time', 'is_overnight')
+
+    class Meta:
+        # The feeds page through (date, start_time, id); each filter column leads its own index
+        indexes = [
+            models.Index(fields=['date', 'start_time', 'id'], name='event_date_idx'),
+            models.Index(fields=['status', 'date', 'start_time', 'id'], name='event_status_date_idx'),
+            models.Index(fields=['city', 'date', 'start_time', 'id'], name='event_city_date_idx'),
+            models.Index(fields=['net_type', 'date', 'start_time', 'id'], name='event_net_type_date_idx'),
+            models.Index(fields=['starts_at'], name='event_starts_at_idx'),
+            # Status sweeps only ever look at events that have not moved on yet
+            models.Index(fields=['status', 'starts_at'], name='event_status_starts_at_idx'),
+            models.Index(fields=['status', 'ends_at'], name='event_status_ends_at_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.starts_at, self.ends_at = self.compute_start_end()
+        update_fields = kwargs.get('update_fields')
+        # Never write a possibly stale in-memory copy of the head counts back over the F() updates
+        if not self._state.adding and self.pk and update_fields is None:
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in self.HEAD_COUNT_FIELDS
+            ]
+        elif update_fields is not None and set(update_fields) & set(self.SCHEDULE_FIELDS):
+            kwargs['update_fields'] = list(update_fields) + ['starts_at', 'ends_at']
+        super().save(*args, **kwargs)
+
+    def compute_start_end(self):
+        """Start and end instants in the server's time zone; overnight events end on the next day."""
+        return compute_start_end(self.date, self.start_time, self.end_time, self.is_overnight)
+
     def get_pending_registration_count(self):
-        pending_registrations = self.registrations.filter(is_approved=False)
-        return sum(registration.number_of_people for registration in pending_registrations)
+        return self.pending_head_count
+
+    @classmethod
+    def adjust_head_counts(cls, event_id, approved=0, pending=0):
+        if approved or pending:
+            cls.objects.filter(pk=event_id).update(
+                approved_head_count=F('approved_head_count') + approved,
+                pending_head_count=F('pending_head_count') + pending,
+            )
+
+    @classmethod
+    def take_spots(cls, event_id, count):
+        """
+        Reserves `count` spots in one conditional UPDATE. Returns False, without
+        changing anything, when fewer than `count` spots are left. An open event
+        whose last spots are taken switches to waitlist in the same statement.
+        """
+        return cls.objects.filter(pk=event_id, spots_left__gte=count).update(
+            spots_left=F('spots_left') - count,
+            # CASE sees the row as it was before the UPDATE
+            status=Case(When(status='open', spots_left=count, then=Value('waitlist')), default=F('status')),
+        ) == 1
+
+    @classmethod
+    def release_spots(cls, event_id, count):
+        """Gives `count` spots back, reopening a waitlisted event in the same statement."""
+        if count:
+            cls.objects.filter(pk=event_id).update(
+                spots_left=F('spots_left') + count,
+                status=Case(When(status='waitlist', spots_left__gt=-count, then=Value('open')), default=F('status')),
+            )
+
+    @classmethod
+    def recount_head_counts(cls, queryset=None):
+        """
+        Recomputes the head counts from the registrations in a single UPDATE.
+        Returns the number of events touched.
+        """
+        if queryset is None:
+            queryset = cls.objects.all()
+        return queryset.update(
+            approved_head_count=_head_count_total(True),
+            pending_head_count=_head_count_total(False),
+        )
+
+def compute_start_end(date, start_time, end_time, is_overnight):
+    starts_at = timezone.make_aware(datetime.datetime.combine(date, start_time))
+    end_date = date + datetime.timedelta(days=1) if is_overnight else date
+    ends_at = timezone.make_aware(datetime.datetime.combine(end_date, end_time))
+    return starts_at, ends_at
+
+def _head_count_total(is_approved):
+    registrations = Registration.objects.filter(event=OuterRef('pk'), is_approved=is_approved)
+    return Coalesce(Subquery(
+        registrations.values('event').annotate(total=Sum('number_of_people')).values('total')
+    ), 0)
 
 class Registration(models.Model):
     event = models.ForeignKey(Event, related_name='registrations', on_delete=models.CASCADE)
@@ -86,22 +186,70 @@ class Registration(models.Model):
     previously_approved = models.BooleanField(default=False)  # 新增字段
     notes = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what this row currently contributes to the event's head counts
+        instance._counted_heads = instance.head_counts()
+        return instance
+
+    def head_counts(self):
+        """(approved, pending) number of people this registration adds to its event."""
+        if self.is_approved:
+            return self.number_of_people, 0
+        return 0, self.number_of_people
     
     def save(self, *args, **kwargs):
         if not self.previously_approved and self.is_approved:
             self.previously_approved = True
-        super().save(*args, **kwargs)
+        previous = getattr(self, '_counted_heads', (0, 0))
+        current = self.head_counts()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Event.adjust_head_counts(self.event_id, current[0] - previous[0], current[1] - previous[1])
+        self._counted_heads = current
         
     class Meta:
         unique_together = ('event', 'user')
+        indexes = [
+            models.Index(fields=['event', 'is_approved'], name='registration_approved_idx'),
+            # Hosts' "waiting for approval" list only ever reads pending rows
+            models.Index(fields=['event'], condition=models.Q(is_approved=False), name='registration_pending_idx'),
+        ]
+
+@receiver(post_delete, sender=Registration)
+def release_registration_head_counts(sender, instance, **kwargs):
+    # Runs for queryset and cascade deletes as well, e.g. when a user deletes their account
+    approved, pending = getattr(instance, '_counted_heads', instance.head_counts())
+    Event.adjust_head_counts(instance.event_id, -approved, -pending)
 
 
 class ChatMessage(models.Model):
     event = models.ForeignKey(Event, related_name='messages', on_delete=models.CASCADE)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='chat_messages', on_delete=models.CASCADE)
     message = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Assigned when the message is received, so buffered (write-behind) rows keep their real time
+    timestamp = models.DateTimeField(default=timezone.now)
+    # Server-assigned id; replaying a write-behind buffer can never insert a message twice
+    uid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # History pages of one room, newest first (events.chat_history)
+            models.Index(fields=['event', '-timestamp', '-uid'], name='chatmessage_history_idx'),
+        ]
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def forget_chat_history_of_user(sender, instance, **kwargs):
+    # The user's messages go with them (cascade); drop the cached copies of every room they wrote in
+    event_ids = list(ChatMessage.objects.filter(user=instance).values_list('event_id', flat=True).distinct())
+    if event_ids:
+        transaction.on_commit(lambda: chat_history.forget_rooms(event_ids))
+
 
+@receiver(post_delete, sender=Event)
+def forget_chat_history_of_event(sender, instance, **kwargs):
+    transaction.on_commit(lambda: chat_history.forget_rooms([instance.id]))
@@ -0,0 +1,222 @@
+# events/pagination.py
+import base64
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import chat_history
+
+
+def encode_cursor(position, reverse=False):
+    """
+    Packs a keyset position (one value per ordering field) into an opaque,
+    URL-safe token. `reverse` marks a cursor that walks back to the previous page.
+    """
+    values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in position]
+    payload = {'p': values}
+    if reverse:
+        payload['r'] = 1
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, ordering):
+    """
+    Returns (position, reverse) for a token produced by encode_cursor.
+    Raises ValueError for anything that was not issued for this ordering.
+    """
+    padded = token + '=' * (-len(token) % 4)
+    payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    position = payload['p']
+    if not isinstance(position, list) or len(position) != len(ordering):
+        raise ValueError('Cursor does not match ordering')
+    return position, bool(payload.get('r'))
+
+
+def coerce_position(model, ordering, position):
+    """
+    Converts the decoded values of a cursor to the Python types of their ordering fields.
+    Raises ValueError for a value the field cannot hold.
+    """
+    values = []
+    for field_name, value in zip(ordering, position):
+        try:
+            value = model._meta.get_field(field_name.lstrip('-')).to_python(value)
+        except ValidationError as e:
+            raise ValueError(e.messages)
+        if value is None:
+            raise ValueError('Cursor position has an empty value')
+        values.append(value)
+    return values
+
+
+def keyset_filter(ordering, position, reverse=False):
+    """
+    Builds the row-value comparison "(f1, f2, ...) > (v1, v2, ...)" as a Q object,
+    honouring the direction of every field in `ordering` ('-field' is descending).
+    With reverse=True the comparison is flipped, i.e. rows *before* the position.
+    """
+    condition = Q()
+    equal_so_far = Q()
+    for field, value in zip(ordering, position):
+        descending = field.startswith('-')
+        name = field.lstrip('-')
+        lookup = 'lt' if descending != reverse else 'gt'
+        condition |= equal_so_far & Q(**{f'{name}__{lookup}': value})
+        equal_so_far &= Q(**{name: value})
+    return condition
+
+
+def position_of(instance, ordering):
+    if isinstance(instance, dict):
+        return [instance[field.lstrip('-')] for field in ordering]
+    return [getattr(instance, field.lstrip('-')) for field in ordering]
+
+
+def invert_ordering(ordering):
+    return [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Cursor pagination that seeks on the full ordering tuple instead of using
+    OFFSET, so every page costs the same no matter how deep the client scrolls.
+    The last ordering field must be unique (normally the primary key).
+    """
+    ordering = ('id',)
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        position, self.reverse = None, False
+        token = request.query_params.get(self.cursor_query_param)
+        if token:
+            try:
+                position, self.reverse = decode_cursor(token, self.ordering)
+                position = coerce_position(queryset.model, self.ordering, position)
+            except (ValueError, KeyError, TypeError):
+                raise NotFound('Invalid cursor')
+
+        ordering = invert_ordering(self.ordering) if self.reverse else list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(keyset_filter(self.ordering, position, self.reverse))
+
+        # Fetch one extra row to find out whether there is another page in this direction
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if self.reverse:
+            results.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                size = int(request.query_params[self.page_size_query_param])
+                if size > 0:
+                    return min(size, self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        token = encode_cursor(position_of(self.page[-1], self.ordering))
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        token = encode_cursor(position_of(self.page[0], self.ordering), reverse=True)
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class EventCursorPagination(KeysetCursorPagination):
+    """Upcoming-first feed ordered by (date, start_time, id)."""
+    ordering = ('date', 'start_time', 'id')
+    page_size = getattr(settings, 'EVENT_FEED_PAGE_SIZE', 20)
+
+
+class InactiveEventCursorPagination(EventCursorPagination):
+    """History feed, most recent first."""
+    ordering = ('-date', '-start_time', '-id')
+
+
+class ChatMessageCursorPagination(KeysetCursorPagination):
+    """
+    Chat history, newest first; `next` leads to earlier messages. Pages are message
+    records (events.chat_history.message_record): recent ones come from the room's hot
+    tier, older ones from the database. uid breaks ties because buffered messages
+    have no id yet.
+    """
+    ordering = chat_history.ORDERING
+    page_size = getattr(settings, 'CHAT_HISTORY_PAGE_SIZE', 50)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        token = request.query_params.get(self.cursor_query_param)
+        position, reverse = None, False
+        if token:
+            try:
+                position, reverse = decode_cursor(token, self.ordering)
+                position = coerce_position(queryset.model, self.ordering, position)
+            except (ValueError, KeyError, TypeError):
+                raise NotFound('Invalid cursor')
+
+        if not reverse:
+            try:
+                page = chat_history.hot_page(view.kwargs['event_id'], position, self.get_page_size(request))
+            except (ValueError, TypeError):
+                raise NotFound('Invalid cursor')
+            if page is not None:
+                self.request = request
+                self.base_url = request.build_absolute_uri()
+                self.page_size = self.get_page_size(request)
+                self.page, self.has_next = page
+                self.reverse, self.has_previous = False, position is not None
+                return self.page
+
+        self.page = [chat_history.message_record(message) for message in super().paginate_queryset(queryset, request, view)]
+        return self.page
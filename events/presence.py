@@ -0,0 +1,77 @@
+# events/presence.py
+import time
+
+import redis
+from django.conf import settings
+
+from volleyball_app.redis_client import get_redis
+
+# Who is looking at which chat room right now. Every open ChatConsumer connection is an entry
+# "<user id>:<channel name>" that expires PRESENCE_TTL seconds after its last heartbeat, so
+# connections of crashed processes age out by themselves.
+#  * Redis: one sorted set per room, scored by expiry time (shared by all ASGI processes)
+#  * without REDIS_URL: a per-process dict, which only sees this process's connections
+PRESENCE_TTL = getattr(settings, 'CHAT_PRESENCE_TTL', 90)
+
+_local_rooms = {}  # event id -> {member: expires_at}
+
+
+def _redis_key(event_id):
+    return f'presence:event:{event_id}'
+
+
+def _member(user_id, channel_name):
+    return f'{user_id}:{channel_name}'
+
+
+def mark_present(event_id, user_id, channel_name):
+    """Adds or refreshes one connection; called on connect and on every heartbeat."""
+    expires_at = time.time() + PRESENCE_TTL
+    member = _member(user_id, channel_name)
+    client = get_redis()
+    if client is None:
+        _local_rooms.setdefault(str(event_id), {})[member] = expires_at
+        return
+    key = _redis_key(event_id)
+    try:
+        pipe = client.pipeline()
+        pipe.zadd(key, {member: expires_at})
+        pipe.expire(key, PRESENCE_TTL * 2)
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"[ERROR] Presence update failed for event {event_id}: {e}")
+
+
+def mark_absent(event_id, user_id, channel_name):
+    member = _member(user_id, channel_name)
+    client = get_redis()
+    if client is None:
+        _local_rooms.get(str(event_id), {}).pop(member, None)
+        return
+    try:
+        client.zrem(_redis_key(event_id), member)
+    except redis.RedisError as e:
+        print(f"[ERROR] Presence removal failed for event {event_id}: {e}")
+
+
+def present_user_ids(event_id):
+    """Ids of the users with at least one live connection to the room."""
+    now = time.time()
+    client = get_redis()
+    if client is None:
+        room = _local_rooms.get(str(event_id), {})
+        members = [member for member, expires_at in room.items() if expires_at > now]
+        for member in [member for member, expires_at in room.items() if expires_at <= now]:
+            room.pop(member, None)
+    else:
+        key = _redis_key(event_id)
+        try:
+            pipe = client.pipeline()
+            pipe.zremrangebyscore(key, '-inf', now)
+            pipe.zrange(key, 0, -1)
+            members = pipe.execute()[1]
+        except redis.RedisError as e:
+            # Nobody counts as present, so everyone gets pushed as before
+            print(f"[ERROR] Presence read failed for event {event_id}: {e}")
+            return set()
+    return {int(member.split(':', 1)[0]) for member in members}
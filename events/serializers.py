@@ -1,8 +1,9 @@
 # events/serializers.py
 from rest_framework import serializers
 from rest_framework import generics
+from django.db.models import Manager, Prefetch, prefetch_related_objects
 from .models import Event, Registration, ChatMessage
-from users.models import Block
+from users.blocks import get_blocked_user_ids
 from django.contrib.auth import get_user_model
 from datetime import datetime
 
@@ -17,6 +18,8 @@ class RegistrationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Registration
         fields = ['id', 'user', 'notes', 'user_id', 'user_nickname', 'user_gender', 'number_of_people', 'is_approved', 'previously_approved', 'created_at']
+        # Approval only changes through the approve/edit/remove flows, which also move the event's spots
+        read_only_fields = ['is_approved', 'previously_approved']
 
     def get_user_id(self, obj):
         return obj.user.id
@@ -34,6 +37,18 @@ class RegistrationSerializer(serializers.ModelSerializer):
         else:
             return current_time  # Show only the current time if there are no notes
     '''
+
+def registrations_prefetch():
+    # All registrations of an event together with their users, split into pending/approved in memory
+    return Prefetch('registrations', queryset=Registration.objects.select_related('user').order_by('id'))
+
+class EventListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Load creators and registrations for the whole page at once instead of per event
+        events = list(data.all() if isinstance(data, Manager) else data)
+        prefetch_related_objects(events, 'created_by', registrations_prefetch())
+        return super().to_representation(events)
+
 class EventSerializer(serializers.ModelSerializer):
     created_by = serializers.StringRelatedField(read_only=True)
     created_by_id = serializers.IntegerField(source='created_by.id', read_only=True)
@@ -46,20 +61,15 @@ class EventSerializer(serializers.ModelSerializer):
     class Meta:
         model = Event
         fields = ['id', 'additional_comments','name', 'cost', 'location', 'date', 'start_time', 'end_time', 'is_overnight', 'spots_left', 'created_by', 'created_by_id', 'created_by_nickname', 'pending_registrations', 'approved_registrations', 'is_creator', 'pending_registration_count', 'net_type', 'status', 'cancellation_message', 'city']
+        list_serializer_class = EventListSerializer
 
     def get_pending_registrations(self, obj):
-        request = self.context.get('request')
-        user = request.user if request else None
-        
-        pending_registrations = Registration.objects.filter(event=obj, is_approved=False)
-        return self._serialize_registrations(pending_registrations, user)
+        pending_registrations = [registration for registration in self._get_registrations(obj) if not registration.is_approved]
+        return self._serialize_registrations(pending_registrations)
 
     def get_approved_registrations(self, obj):
-        request = self.context.get('request')
-        user = request.user if request else None
-
-        approved_registrations = Registration.objects.filter(event=obj, is_approved=True)
-        return self._serialize_registrations(approved_registrations, user)
+        approved_registrations = [registration for registration in self._get_registrations(obj) if registration.is_approved]
+        return self._serialize_registrations(approved_registrations)
     
     def get_is_creator(self, obj):
         request = self.context.get('request', None)
@@ -73,11 +83,29 @@ class EventSerializer(serializers.ModelSerializer):
     def get_created_by_nickname(self, obj):
         return obj.created_by.nickname if hasattr(obj.created_by, 'nickname') else None
 
-    def _serialize_registrations(self, registrations, viewer):
+    def _get_registrations(self, obj):
+        # Single events (detail view) are not prefetched by EventListSerializer
+        if 'registrations' not in getattr(obj, '_prefetched_objects_cache', {}):
+            prefetch_related_objects([obj], registrations_prefetch())
+        return obj.registrations.all()
+
+    def _get_blocked_user_ids(self):
+        # The context is shared by every event in a list, so the viewer's blocks are loaded once per request
+        if '_blocked_user_ids' not in self.context:
+            request = self.context.get('request')
+            viewer = request.user if request else None
+            if viewer is not None and viewer.is_authenticated:
+                self.context['_blocked_user_ids'] = get_blocked_user_ids(viewer.id)
+            else:
+                self.context['_blocked_user_ids'] = frozenset()
+        return self.context['_blocked_user_ids']
+
+    def _serialize_registrations(self, registrations):
+        blocked_user_ids = self._get_blocked_user_ids()
         serialized_data = []
         for registration in registrations:
             # Check if the registrant is blocked by the viewer
-            if viewer.is_authenticated and Block.objects.filter(blocker=viewer, blocked=registration.user).exists():
+            if registration.user_id in blocked_user_ids:
                 # If the registrant is blocked, mask their details
                 masked_data = {
                     "user": "已封鎖的用戶",
@@ -0,0 +1,15 @@
+from celery import shared_task
+
+from . import chat_buffer
+
+
+@shared_task
+def flush_chat_buffer():
+    """
+    Runs every minute from celery beat. Writes chat messages still sitting in the write-behind
+    Redis stream, e.g. because the ASGI process that buffered them died before flushing.
+    """
+    flushed = chat_buffer.flush()
+    if flushed:
+        print(f"[chat] replayed {flushed} buffered messages")
+    return flushed
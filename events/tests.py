@@ -1,3 +1,469 @@
-from django.test import TestCase
+import datetime
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from notifications.models import Notification, NotificationOutbox
+from notifications.outbox import notify_users
+from notifications.tasks import drain_notification_outbox
+from users.blocks import invalidate_blocked_user_ids
+from users.models import Block
+from volleyball_app.routing import websocket_urlpatterns
+from . import chat_history
+from .consumers import ChatConsumer
+from .filters import EventFilterBackend
+from .pagination import encode_cursor
+from .models import ChatMessage, Event, Registration
+from .serializers import EventSerializer
+from .views import ActiveEventsListAPIView, EventListAPIView
+
+CustomUser = get_user_model()
+
+
+class EventListQueryCountTests(TestCase):
+    """The event feeds must not issue per-event or per-registration queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = CustomUser.objects.create(username='host', nickname='host')
+        cls.viewer = CustomUser.objects.create(username='viewer', nickname='viewer')
+        cls.players = [CustomUser.objects.create(username=f'player{i}', nickname=f'player{i}') for i in range(6)]
+        Block.objects.create(blocker=cls.viewer, blocked=cls.players[0])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def create_events(self, count):
+        for i in range(count):
+            event = Event.objects.create(
+                name=f'event {i}', location='court', date=datetime.date(2030, 1, 1) + datetime.timedelta(days=i),
+                start_time=datetime.time(19), end_time=datetime.time(21), cost=100, spots_left=12,
+                created_by=self.host, status='open',
+            )
+            for j, player in enumerate(self.players):
+                Registration.objects.create(event=event, user=player, number_of_people=1, is_approved=j % 2 == 0)
+
+    def assert_constant_queries(self, url):
+        # events page (with creators joined) + registrations (with users joined) + viewer's blocks
+        for total in (2, 10):
+            self.create_events(total - Event.objects.count())
+            invalidate_blocked_user_ids(self.viewer.id)
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), total)
+
+    def test_event_list_query_count_is_constant(self):
+        self.assert_constant_queries('/api/events/')
+
+    def test_active_event_list_query_count_is_constant(self):
+        self.assert_constant_queries('/events/active/')
+
+    def test_blocked_registrant_is_masked(self):
+        self.create_events(1)
+        response = self.client.get('/api/events/')
+        approved = response.data['results'][0]['approved_registrations']
+        self.assertEqual(approved[0]['user_nickname'], '已封鎖的用戶')
+        self.assertEqual(approved[1]['user_nickname'], 'player2')
+
+
+class EventFilterIndexTests(TestCase):
+    """The common feed filters must be answered from the composite indexes on Event."""
+
+    @classmethod
+    def setUpTestData(cls):
+        host = CustomUser.objects.create(username='host', nickname='host')
+        cities = ['taipei', 'new_taipei', 'taichung', 'kaohsiung']
+        for i in range(40):
+            Event.objects.create(
+                name=f'event {i}', location='court', date=datetime.date(2030, 1, 1) + datetime.timedelta(days=i),
+                start_time=datetime.time(19), end_time=datetime.time(21), cost=100, spots_left=i % 3,
+                created_by=host, status=['open', 'waitlist', 'past'][i % 3], city=cities[i % 4],
+                net_type='men_net_mixed' if i % 2 else 'women_net_mixed',
+            )
+
+    def feed_plan(self, view_class, url):
+        request = Request(APIRequestFactory().get(url))
+        view = view_class(request=request, format_kwarg=None)
+        queryset = EventFilterBackend().filter_queryset(request, view.get_queryset(), view)
+        queryset = queryset.order_by('date', 'start_time', 'id')[:21]
+        if connection.vendor == 'postgresql':
+            # A table this small would always be read sequentially otherwise
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+        return queryset.explain()
+
+    def test_city_filter_uses_index(self):
+        self.assertIn('event_city_date_idx', self.feed_plan(ActiveEventsListAPIView, '/events/active/?city=taipei&date_from=2030-01-05'))
+
+    def test_net_type_filter_uses_index(self):
+        self.assertIn('event_net_type_date_idx', self.feed_plan(ActiveEventsListAPIView, '/events/active/?net_type=men_net_mixed'))
+
+    def test_status_filter_uses_index(self):
+        self.assertIn('event_status_date_idx', self.feed_plan(EventListAPIView, '/api/events/?status=open'))
+
+    def test_date_range_uses_index(self):
+        self.assertIn('event_date_idx', self.feed_plan(EventListAPIView, '/api/events/?date_from=2030-01-03&date_to=2030-01-10'))
+
+    def test_unknown_filter_value_is_rejected(self):
+        response = APIClient().get('/api/events/?city=atlantis')
+        self.assertEqual(response.status_code, 400)
+
+    def test_starts_within_must_be_a_sane_number_of_hours(self):
+        for value in ('nan', 'inf', '-inf', '1e30', '0', '-2', 'soon'):
+            response = APIClient().get('/api/events/', {'starts_within': value})
+            self.assertEqual(response.status_code, 400, value)
+        self.assertEqual(APIClient().get('/api/events/', {'starts_within': '2.5'}).status_code, 200)
+
+    def test_cursor_with_bad_values_is_rejected(self):
+        for position in (['garbage', 'x', 1], ['2030-01-01', '19:00', 'x'], ['2030-01-01', None, 1]):
+            response = APIClient().get('/api/events/', {'cursor': encode_cursor(position)})
+            self.assertEqual(response.status_code, 404)
+        response = APIClient().get('/api/events/', {'cursor': encode_cursor(['2030-01-01', '19:00', 1])})
+        self.assertEqual(response.status_code, 200)
+
+    def test_filters_narrow_the_feed(self):
+        response = APIClient().get('/api/events/?city=taipei&has_spots=true&page_size=100')
+        self.assertTrue(response.data['results'])
+        for event in response.data['results']:
+            self.assertEqual(event['city'], 'taipei')
+            self.assertGreater(event['spots_left'], 0)
+
+
+class CancelEventFanOutTests(TestCase):
+    """Cancelling an event writes its notifications in bulk, however many people registered."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = CustomUser.objects.create(username='host', nickname='host')
+        cls.players = [CustomUser.objects.create(username=f'player{i}', nickname=f'player{i}') for i in range(30)]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.host)
+
+    def cancel_event_with(self, attendees):
+        event = Event.objects.create(
+            name='event', location='court', date=datetime.date(2030, 1, 1), start_time=datetime.time(19),
+            end_time=datetime.time(21), cost=100, spots_left=40, created_by=self.host, status='open',
+        )
+        for player in self.players[:attendees]:
+            Registration.objects.create(event=event, user=player, number_of_people=1, is_approved=True)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'/events/cancel/{event.id}/', {'cancellation_message': 'rain'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Notification.objects.filter(event_id=event.id).count(), attendees + 1)
+        self.assertEqual(NotificationOutbox.objects.filter(notification__event_id=event.id).count(), attendees + 1)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_attendees(self):
+        self.assertEqual(self.cancel_event_with(30), self.cancel_event_with(3))
+
+
+class SpotAccountingTests(TestCase):
+    """Edits of events and registrations keep spots_left and the head counts consistent."""
+
+    def setUp(self):
+        self.host = CustomUser.objects.create(username='host', nickname='host')
+        self.player = CustomUser.objects.create(username='player', nickname='player')
+        self.event = Event.objects.create(
+            name='event', location='court', date=datetime.date(2030, 1, 1), start_time=datetime.time(19),
+            end_time=datetime.time(21), cost=100, spots_left=10, created_by=self.host, status='open',
+        )
+        self.client = APIClient()
+
+    def test_reregistering_an_approved_registration_returns_its_spots(self):
+        Registration.objects.create(event=self.event, user=self.player, number_of_people=2, is_approved=True)
+        Event.take_spots(self.event.id, 2)
+
+        self.client.force_authenticate(self.player)
+        response = self.client.post(f'/api/register/{self.event.id}/', {'number_of_people': 3}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.event.refresh_from_db()
+        registration = Registration.objects.get(event=self.event, user=self.player)
+        self.assertFalse(registration.is_approved)
+        self.assertEqual(self.event.spots_left, 10)
+        self.assertEqual((self.event.approved_head_count, self.event.pending_head_count), (0, 3))
+
+    def test_event_edit_keeps_spots_taken_meanwhile(self):
+        self.client.force_authenticate(self.host)
+        is_valid = EventSerializer.is_valid
+
+        def is_valid_then_take_spots(serializer, *args, **kwargs):
+            # A registration is approved between reading the event and saving the edit
+            Event.take_spots(self.event.id, 2)
+            return is_valid(serializer, *args, **kwargs)
+
+        with mock.patch.object(EventSerializer, 'is_valid', is_valid_then_take_spots):
+            response = self.client.patch(f'/events/update/{self.event.id}/', {'name': 'renamed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.event.refresh_from_db()
+        self.assertEqual((self.event.name, self.event.spots_left), ('renamed', 8))
+
+    def test_approval_commits_together_with_its_notification(self):
+        registration = Registration.objects.create(event=self.event, user=self.player, number_of_people=2)
+        self.client.force_authenticate(self.host)
+        with mock.patch('events.views.notify_users', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            self.client.post(f'/api/approve/{registration.id}/')
+
+        registration.refresh_from_db()
+        self.event.refresh_from_db()
+        self.assertFalse(registration.is_approved)
+        self.assertEqual((self.event.spots_left, self.event.approved_head_count), (10, 0))
+
+
+class HeadCountTests(TestCase):
+    """approved_head_count / pending_head_count always match a recount from the registrations."""
+
+    def setUp(self):
+        self.host = CustomUser.objects.create(username='host', nickname='host')
+        self.players = [CustomUser.objects.create(username=f'player{i}', nickname=f'player{i}') for i in range(3)]
+        self.event = Event.objects.create(
+            name='event', location='court', date=datetime.date(2030, 1, 1), start_time=datetime.time(19),
+            end_time=datetime.time(21), cost=100, spots_left=10, created_by=self.host, status='open',
+        )
+        self.client = APIClient()
+        patcher = mock.patch('notifications.outbox.kick_drainer')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def register(self, player, number_of_people):
+        self.client.force_authenticate(player)
+        response = self.client.post(f'/api/register/{self.event.id}/', {'number_of_people': number_of_people}, format='json')
+        self.assertIn(response.status_code, (200, 201))
+        return Registration.objects.get(event=self.event, user=player)
+
+    def approve(self, registration):
+        self.client.force_authenticate(self.host)
+        response = self.client.post(f'/api/approve/{registration.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def assertHeadCounts(self, approved, pending):
+        self.event.refresh_from_db()
+        stored = (self.event.approved_head_count, self.event.pending_head_count)
+        Event.recount_head_counts(Event.objects.filter(pk=self.event.pk))
+        self.event.refresh_from_db()
+        self.assertEqual(stored, (self.event.approved_head_count, self.event.pending_head_count))
+        self.assertEqual(stored, (approved, pending))
+
+    def test_register_and_approve(self):
+        registration = self.register(self.players[0], 2)
+        self.register(self.players[1], 3)
+        self.assertHeadCounts(0, 5)
+
+        self.approve(registration)
+        self.assertHeadCounts(2, 3)
+
+    def test_unapprove(self):
+        registration = self.register(self.players[0], 2)
+        self.approve(registration)
+
+        self.client.force_authenticate(self.host)
+        response = self.client.post(
+            f'/events/{self.event.id}/remove_user/{self.players[0].id}/', {'message': 'full'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertHeadCounts(0, 2)
+
+    def test_edit(self):
+        pending = self.register(self.players[0], 2)
+        approved = self.register(self.players[1], 3)
+        self.approve(approved)
+
+        self.client.force_authenticate(self.players[0])
+        response = self.client.patch(f'/api/edit_registration/{pending.id}/', {'number_of_people': 4}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertHeadCounts(3, 4)
+
+        # An approved registration that shrinks stays approved, one that grows needs approval again
+        self.client.force_authenticate(self.players[1])
+        response = self.client.patch(f'/api/edit_registration/{approved.id}/', {'number_of_people': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertHeadCounts(1, 4)
+        response = self.client.patch(f'/api/edit_registration/{approved.id}/', {'number_of_people': 2}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertHeadCounts(0, 6)
+
+    def test_delete(self):
+        self.approve(self.register(self.players[0], 2))
+        self.register(self.players[1], 3)
+
+        self.client.force_authenticate(self.players[0])
+        self.assertEqual(self.client.post(f'/api/unregister/{self.event.id}/').status_code, 200)
+        self.assertHeadCounts(0, 3)
+
+        Registration.objects.filter(event=self.event).delete()
+        self.assertHeadCounts(0, 0)
+
+    def test_cascade_delete(self):
+        self.approve(self.register(self.players[0], 2))
+        self.register(self.players[1], 3)
+        self.register(self.players[2], 1)
+
+        self.players[0].delete()
+        self.players[1].delete()
+        self.assertHeadCounts(0, 1)
+
+    def test_recount_registrations_command(self):
+        other = Event.objects.create(
+            name='other', location='court', date=datetime.date(2030, 1, 2), start_time=datetime.time(19),
+            end_time=datetime.time(21), cost=100, spots_left=10, created_by=self.host, status='open',
+        )
+        self.approve(self.register(self.players[0], 2))
+        self.register(self.players[1], 3)
+        Registration.objects.create(event=other, user=self.players[2], number_of_people=4)
+        Event.objects.update(approved_head_count=99, pending_head_count=-1)
+
+        out = StringIO()
+        call_command('recount_registrations', self.event.id, stdout=out)
+        self.assertIn('1 events', out.getvalue())
+        self.assertHeadCounts(2, 3)
+        other.refresh_from_db()
+        self.assertEqual((other.approved_head_count, other.pending_head_count), (99, -1))
+
+        call_command('recount_registrations', '--batch-size', '1', stdout=StringIO())
+        other.refresh_from_db()
+        self.assertEqual((other.approved_head_count, other.pending_head_count), (0, 4))
+
+
+class ChatHistoryPaginationTests(TestCase):
+    """Chat history is served a page at a time, newest first, from the hot tier where possible."""
+
+    def setUp(self):
+        chat_history._local_rooms.clear()
+        self.host = CustomUser.objects.create(username='host', nickname='host')
+        self.player = CustomUser.objects.create(username='player', nickname='player')
+        self.event = Event.objects.create(
+            name='event', location='court', date=datetime.date(2030, 1, 1), start_time=datetime.time(19),
+            end_time=datetime.time(21), cost=100, spots_left=12, created_by=self.host, status='open',
+        )
+        for i in range(60):
+            ChatMessage.objects.create(event=self.event, user=[self.host, self.player][i % 2], message=f'message {i}')
+        self.client = APIClient()
+        self.client.force_authenticate(self.player)
+
+    def test_pages_walk_back_through_history(self):
+        with self.assertNumQueries(2):
+            first = self.client.get(f'/events/{self.event.id}/messages/?page_size=40')
+        self.assertEqual(first.data['results'][0]['message'], 'message 59')
+        self.assertEqual(first.data['results'][0]['user_nickname'], 'player')
+        second = self.client.get(first.data['next'])
+        self.assertEqual([m['message'] for m in second.data['results']][-1], 'message 0')
+        self.assertEqual(len(second.data['results']), 20)
+        self.assertIsNone(second.data['next'])
+
+    def test_hot_tier_keeps_each_message_once(self):
+        records, _ = chat_history.recent_records(self.event.id)
+        chat_history.remember(self.event.id, records[0])
+        self.assertEqual(len(chat_history.recent_records(self.event.id)[0]), 60)
+
+    def test_idle_rooms_are_dropped(self):
+        chat_history.recent_records(self.event.id)
+        later = time.monotonic() + chat_history.HOT_TTL + 1
+        with mock.patch.object(chat_history.time, 'monotonic', return_value=later):
+            chat_history.remember(self.event.id, chat_history.message_record(ChatMessage.objects.first()))
+        self.assertNotIn(str(self.event.id), chat_history._local_rooms)
+
+    def test_deleting_an_author_drops_their_cached_messages(self):
+        self.client.get(f'/events/{self.event.id}/messages/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.player.delete()
+        response = self.client.get(f'/events/{self.event.id}/messages/?page_size=100')
+        self.assertEqual(len(response.data['results']), 30)
+        self.assertEqual({m['user_id'] for m in response.data['results']}, {self.host.id})
+
+    def test_cursor_with_bad_values_is_rejected(self):
+        for position in (['garbage', 'x'], ['2030-01-01T00:00:00+00:00', 'not-a-uuid']):
+            response = self.client.get(f'/events/{self.event.id}/messages/', {'cursor': encode_cursor(position)})
+            self.assertEqual(response.status_code, 404)
+
+    def test_warm_room_is_served_without_chat_queries(self):
+        self.client.get(f'/events/{self.event.id}/messages/')
+        self.client.post(f'/events/{self.event.id}/messages/send/', {'message': 'fresh'})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/events/{self.event.id}/messages/?page_size=10')
+        self.assertFalse([q for q in queries if 'events_chatmessage' in q['sql']])
+        self.assertEqual(response.data['results'][0]['message'], 'fresh')
+
+    def test_older_pages_fall_back_to_the_database(self):
+        with mock.patch.object(chat_history, 'HOT_SIZE', 30):
+            first = self.client.get(f'/events/{self.event.id}/messages/?page_size=25')
+            self.assertEqual(len(chat_history._local_rooms[str(self.event.id)][1]), 30)
+            second = self.client.get(first.data['next'])
+            third = self.client.get(second.data['next'])
+        messages = [m['message'] for page in (first, second, third) for m in page.data['results']]
+        self.assertEqual(messages, [f'message {i}' for i in range(59, -1, -1)])
+        self.assertIsNone(third.data['next'])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class LiveConsumerTests(TransactionTestCase):
+    """One ws/live/ socket carries several chat rooms and the user's notifications."""
+
+    def test_rooms_and_notifications_share_one_socket(self):
+        chat_history._local_rooms.clear()
+        host = CustomUser.objects.create(username='host', nickname='host')
+        player = CustomUser.objects.create(username='player', nickname='player')
+        events = [
+            Event.objects.create(
+                name=f'event {i}', location='court', date=datetime.date(2030, 1, 1), start_time=datetime.time(19),
+                end_time=datetime.time(21), cost=100, spots_left=12, created_by=host, status='open',
+            )
+            for i in range(2)
+        ]
+        application = URLRouter(websocket_urlpatterns)
+
+        async def scenario():
+            live = WebsocketCommunicator(application, '/ws/live/')
+            live.scope['user'] = player
+            await live.connect()
+            for event in events:
+                await live.send_json_to({'type': 'subscribe', 'event_id': event.id})
+                history = await live.receive_json_from()
+                self.assertEqual((history['type'], history['event_id']), ('history', event.id))
+
+            room = WebsocketCommunicator(application, f'/ws/events/{events[1].id}/chat/')
+            room.scope['user'] = host
+            await room.connect()
+            await room.receive_json_from()
+            await room.send_json_to({'message': 'hello'})
+            await room.receive_json_from()
+            message = await live.receive_json_from()
+            self.assertEqual((message['type'], message['event_id'], message['message']), ('message', events[1].id, 'hello'))
+
+            await live.send_json_to({'type': 'unsubscribe', 'event_id': events[1].id})
+            await live.send_json_to({'type': 'message', 'event_id': events[1].id, 'message': 'late'})
+            self.assertEqual((await live.receive_json_from())['message'], 'Not subscribed')
+
+            def notify():
+                notify_users([player.id], 'title', 'body', event_id=events[0].id)
+                drain_notification_outbox()
+            await sync_to_async(notify)()
+            notification = await live.receive_json_from()
+            self.assertEqual(notification['type'], 'notification')
+            self.assertEqual(notification['notification']['message'], 'body')
+
+            await room.disconnect()
+            await live.disconnect()
+
+        with mock.patch('notifications.tasks.send_chat_notifications.apply_async'), mock.patch('notifications.outbox.kick_drainer'):
+            async_to_sync(scenario)()
+
+    def test_chat_notifications_do_not_retry_the_broker(self):
+        with mock.patch('notifications.tasks.send_chat_notifications.apply_async', side_effect=ConnectionError) as apply_async:
+            async_to_sync(ChatConsumer().notify_users_about_event)('7', 3, 'hello')
+        apply_async.assert_called_once_with((7, 3, 'hello'), retry=False)
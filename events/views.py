@@ -10,31 +10,33 @@ from rest_framework import generics, status, permissions
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, AllowAny
 from rest_framework.response import Response
-from notifications.models import Notification
 from .serializers import RegistrationSerializer, ChatMessageSerializer
-from notifications.utils import send_notification, send_bulk_notification
+from .pagination import ChatMessageCursorPagination, EventCursorPagination, InactiveEventCursorPagination
+from .filters import EventFilterBackend
+from . import chat_history
+from notifications.outbox import notify_users
 from notifications.tasks import cancel_old_notifications, schedule_reminders, schedule_event_status_updates, set_event_status, broadcast_new_event_notification_in_chunks
+from django.db import transaction
 from django.utils import timezone
+from rest_framework.exceptions import PermissionDenied
 import datetime
 from datetime import timedelta
 
 def notify_user_about_event(user, event_id, title, message):
-    # Create the notification
-    notification = Notification.objects.create(
-        user=user,
-        title=title,
-        message=message,
-        event_id=event_id
-    )
-    send_notification(user, title, message)
+    # Stores the notification; the push is delivered by the outbox drainer after commit
+    notify_users([user.id], title, message, event_id=event_id)
+
+def notify_users_about_event(user_ids, event_id, title, message):
+    notify_users(user_ids, title, message, event_id=event_id)
 
 class ChatMessageListView(APIView):
     def get(self, request, event_id):
         try:
             event = Event.objects.get(id=event_id)
-            messages = ChatMessage.objects.filter(event=event)
-            serializer = ChatMessageSerializer(messages, many=True)
-            return Response(serializer.data)
+            messages = ChatMessage.objects.filter(event=event).select_related('user')
+            paginator = ChatMessageCursorPagination()
+            page = paginator.paginate_queryset(messages, request, view=self)
+            return paginator.get_paginated_response(page)
         except Event.DoesNotExist:
             return Response({"error": "Event not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -49,6 +51,7 @@ class SendMessageView(APIView):
                 return Response({"error": "Message cannot be empty"}, status=status.HTTP_400_BAD_REQUEST)
             
             chat_message = ChatMessage.objects.create(event=event, user=user, message=message)
+            chat_history.remember(event.id, chat_history.message_record(chat_message))
             serializer = ChatMessageSerializer(chat_message)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         except Event.DoesNotExist:
@@ -71,22 +74,21 @@ class RemoveUserFromApprovedListView(APIView):
             if event.created_by != request.user:
                 return Response({"error": "You are not authorized to remove users from this event"}, status=status.HTTP_403_FORBIDDEN)
             
-            # Fetch the registration for the user
-            registration = Registration.objects.get(event=event, user_id=user_id)
-            
-            # Check if the user is approved
-            if registration.is_approved:
-                # Remove user from the approved list by updating the registration status
-                registration.is_approved = False
-                event.spots_left += registration.number_of_people
-                if event.status == 'waitlist' and event.spots_left > 0:
-                    event.status = 'open'
-                event.save()
-                registration.save()
-                
-                # Notify the user about the change
-                notify_user_about_event(registration.user, event_id, "報名更改通知", f"{event.name} 的活動發起人已將您移出參加名單。原因: {cancellation_message}")
-                
+            with transaction.atomic():
+                # Fetch and lock the registration for the user
+                registration = Registration.objects.select_for_update().get(event=event, user_id=user_id)
+                removed = registration.is_approved
+
+                # Check if the user is approved
+                if removed:
+                    # Remove user from the approved list by updating the registration status
+                    registration.is_approved = False
+                    registration.save()
+                    Event.release_spots(event.id, registration.number_of_people)
+                    # Notify the user about the change
+                    notify_user_about_event(registration.user, event_id, "報名更改通知", f"{event.name} 的活動發起人已將您移出參加名單。原因: {cancellation_message}")
+
+            if removed:
                 return Response({"message": "User removed from the approved list successfully"}, status=status.HTTP_200_OK)
             else:
                 return Response({"error": "User is not approved for this event"}, status=status.HTTP_400_BAD_REQUEST)
@@ -112,17 +114,16 @@ class CancelEventView(APIView):
             if event.created_by != request.user:
                 return Response({"error": "You are not authorized to cancel this event"}, status=status.HTTP_403_FORBIDDEN)
             
-            event.status = 'canceled'
-            event.cancellation_message = cancellation_message
-            event.save()
-            print(event.status)
-            cancel_old_notifications(event)
-            notify_user_about_event(request.user, event_id, "活動取消通知", f'您已成功取消這個活動 原因: {cancellation_message}')
-            # Notify all users associated with the event
-            users = event.attendees.all()
-            for user in users:
-                if user != request.user:
-                    notify_user_about_event(user, event_id, "活動取消通知", f'您報名的活動 {event.name} 已被取消，原因: {cancellation_message}')
+            # The cancellation and its notifications commit together; pushes go out afterwards
+            with transaction.atomic():
+                event.status = 'canceled'
+                event.cancellation_message = cancellation_message
+                event.save(update_fields=['status', 'cancellation_message'])
+                cancel_old_notifications(event)
+                notify_user_about_event(request.user, event_id, "活動取消通知", f'您已成功取消這個活動 原因: {cancellation_message}')
+                # Notify all users associated with the event
+                attendee_ids = event.attendees.exclude(pk=request.user.pk).values_list('pk', flat=True)
+                notify_users_about_event(attendee_ids, event_id, "活動取消通知", f'您報名的活動 {event.name} 已被取消，原因: {cancellation_message}')
 
             return Response({"message": "Event canceled and notifications sent"}, status=status.HTTP_200_OK)
 
@@ -142,14 +143,17 @@ class UpdateEventView(generics.UpdateAPIView):
         return event
 
     def perform_update(self, serializer):
-        event = self.get_object()
-        updated_event = serializer.save()
-        if updated_event.spots_left > 0:
-            updated_event.status = "open"
-        else:
-            updated_event.status = "waitlist"
+        with transaction.atomic():
+            # Re-read the event under a row lock: the full-row save must not write back the
+            # spots_left/status read before a concurrent take_spots/release_spots committed
+            serializer.instance = Event.objects.select_for_update().get(pk=serializer.instance.pk)
+            updated_event = serializer.save()
+            if updated_event.spots_left > 0:
+                updated_event.status = "open"
+            else:
+                updated_event.status = "waitlist"
 
-        updated_event.save()
+            updated_event.save(update_fields=['status'])
             # Cancel old reminders and schedule new ones
         cancel_old_notifications(updated_event)
         schedule_reminders(updated_event, updated_event.is_overnight)
@@ -158,8 +162,9 @@ class UpdateEventView(generics.UpdateAPIView):
         self.notify_users(updated_event)
 
     def notify_users(self, event):
-        registrations = event.registrations.all()  # Fetch all registrations
-        send_bulk_notification(registrations, event)
+        # Push only, no inbox entry (same as before); delivered by the outbox drainer
+        user_ids = event.registrations.values_list('user_id', flat=True)
+        notify_users(user_ids, "活動資訊更改", f"活動 {event.name} 的內容已被更改，請重新確認活動時間，地點，要求等", store=False)
 
 class VerifyUserRegistrationAPIView(APIView):
     permission_classes = [IsAuthenticated]  # Ensure the user is authenticated
@@ -179,7 +184,7 @@ class UserRegistrationsAPIView(generics.ListAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        return Registration.objects.filter(user=user)
+        return Registration.objects.filter(user=user).select_related('user')
 
 class PendingRegistrationsAPIView(generics.ListAPIView):
     serializer_class = RegistrationSerializer
@@ -187,37 +192,39 @@ class PendingRegistrationsAPIView(generics.ListAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        return Registration.objects.filter(event__created_by=user, is_approved=False)
+        return Registration.objects.filter(event__created_by=user, is_approved=False).select_related('user')
 
 class ApproveRegistrationAPIView(APIView):
     permission_classes = [IsAuthenticated]  # 确保用户登录
 
     def post(self, request, registration_id):
-        registration = get_object_or_404(Registration, id=registration_id)
-        event = registration.event
+        with transaction.atomic():
+            # Lock the registration so two approvals of the same row cannot both take spots
+            registration = get_object_or_404(
+                Registration.objects.select_for_update(of=('self',)).select_related('event'), id=registration_id
+            )
+            event = registration.event
+
+            if event.created_by != request.user:
+                return Response({"error": "You are not authorized to approve this registration."}, status=status.HTTP_403_FORBIDDEN)
 
-        if event.created_by != request.user:
-            return Response({"error": "You are not authorized to approve this registration."}, status=status.HTTP_403_FORBIDDEN)
+            if registration.is_approved:
+                return Response({"error": "Registration is already approved."}, status=status.HTTP_400_BAD_REQUEST)
 
-        if event.spots_left < registration.number_of_people:
-            return Response({"error": "Not enough spots left for this number of people."}, status=status.HTTP_400_BAD_REQUEST)
+            if not Event.take_spots(event.id, registration.number_of_people):
+                return Response({"error": "Not enough spots left for this number of people."}, status=status.HTTP_400_BAD_REQUEST)
 
-        registration.is_approved = True
-        event.spots_left -= registration.number_of_people
-        if event.spots_left == 0:
-            event.status = "waitlist"
-            
-        registration.save()
-        event.save()
+            registration.is_approved = True
+            registration.save()
 
-        # 创建通知 
-        message = f"你的在 {event.name} 已被審核通過，請準時抵達活動地點"
-        notify_user_about_event(registration.user, event.id, '報名審核通過', message)
+            # 创建通知 
+            message = f"你的在 {event.name} 已被審核通過，請準時抵達活動地點"
+            notify_user_about_event(registration.user, event.id, '報名審核通過', message)
 
         return Response({"success": "Registration approved successfully."}, status=status.HTTP_200_OK)
 
 class EventDetailAPIView(generics.RetrieveAPIView):
-    queryset = Event.objects.all()
+    queryset = Event.objects.select_related('created_by')
     serializer_class = EventSerializer
     permission_classes = [AllowAny]
 
@@ -246,6 +253,8 @@ class AddEventAPIView(APIView):
 class EventListAPIView(generics.ListAPIView):
     permission_classes = [AllowAny]
     serializer_class = EventSerializer
+    pagination_class = EventCursorPagination
+    filter_backends = [EventFilterBackend]
     
     def get_queryset(self):
         # Check if the request user is authenticated
@@ -258,11 +267,30 @@ class EventListAPIView(generics.ListAPIView):
         else:
             # If the user is not authenticated, return all events
         '''
-        queryset = Event.objects.all()
+        queryset = Event.objects.select_related('created_by')
 
         return queryset
     
 
+def change_number_of_people(registration, new_number_of_people):
+    """
+    Spot accounting for a new number_of_people on a registration locked by the caller.
+    Returns the approval fields to save with it: an approved registration that shrinks gives
+    the difference back, one that grows gives all its spots back and needs approval again.
+    """
+    # Case 1: User is trying to lower the number of people
+    if new_number_of_people < registration.number_of_people:
+        if registration.is_approved:
+            Event.release_spots(registration.event_id, registration.number_of_people - new_number_of_people)
+
+    # Case 2: User is trying to increase the number of people
+    elif new_number_of_people > registration.number_of_people:
+        # No restriction on the number of spots left
+        if registration.is_approved:
+            Event.release_spots(registration.event_id, registration.number_of_people)  # Return the previously taken spots
+            return {'is_approved': False, 'previously_approved': True}  # Needs to be approved again
+    return {}
+
 class EditRegistrationAPIView(generics.UpdateAPIView):
     serializer_class = RegistrationSerializer   
     permission_classes = [IsAuthenticated]
@@ -277,39 +305,18 @@ class EditRegistrationAPIView(generics.UpdateAPIView):
         if instance.user != request.user:
             raise PermissionDenied("You do not have permission to edit this registration.")
 
-        data = request.data.copy()
-        event = instance.event
-
-        # Fetch the new number of people from the request (or default to current number_of_people)
-        new_number_of_people = int(data.get('number_of_people', instance.number_of_people))
-
-        # Case 1: User is trying to lower the number of people
-        if new_number_of_people < instance.number_of_people:
-            if instance.is_approved:
-                event.spots_left += (instance.number_of_people - new_number_of_people)
-                event.save()
-            data['is_approved'] = instance.is_approved  # Keep current approval status
-
-        # Case 2: User is trying to increase the number of people
-        elif new_number_of_people > instance.number_of_people:
-            # No restriction on the number of spots left
-            if instance.is_approved:
-                event.spots_left += instance.number_of_people  # Return the previously taken spots
-                data['is_approved'] = False  # Set to unapproved
-                data['previously_approved'] = True  # Mark as previously approved
-                event.save()
-            else:
-                event.save()
+        with transaction.atomic():
+            # Re-read the registration under a row lock so concurrent edits/approvals see each other
+            instance = Registration.objects.select_for_update().get(pk=instance.pk)
 
-        # Check if the event status should be updated from 'waitlist' to 'open'
-        if event.spots_left > 0 and event.status == 'waitlist':
-            event.status = 'open'
-            event.save()
+            # Fetch the new number of people from the request (or default to current number_of_people)
+            new_number_of_people = int(request.data.get('number_of_people', instance.number_of_people))
+            approval = change_number_of_people(instance, new_number_of_people)
 
-        # Apply the new data to the serializer and perform the update
-        serializer = self.get_serializer(instance, data=data, partial=partial)
-        serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
+            # Apply the new data to the serializer and perform the update
+            serializer = self.get_serializer(instance, data=request.data, partial=partial)
+            serializer.is_valid(raise_exception=True)
+            serializer.save(**approval)
 
         return Response(serializer.data)
 
@@ -323,34 +330,39 @@ class RegisterEventAPIView(APIView):
         event = get_object_or_404(Event, id=event_id)
         user = request.user
         
-        registration, created = Registration.objects.get_or_create(event=event, user=user)
-        #send_notification(user, "註冊成功！", f"您已經成功申請註冊 {event.name}")
-        serializer = RegistrationSerializer(data=request.data, instance=registration)
-        if serializer.is_valid():
-            registration = serializer.save()  
-            '''
-            if event.spots_left - registration.number_of_people < 0:
-                return Response({"error": "Not enough spots left for this number of people."}, status=status.HTTP_400_BAD_REQUEST)
-            '''
-            registration.save()
-            event.save()
-
-            # 创建新的通知
-            message = ""
-            if created:
-                message = f"新的報名： {user.nickname} 已申請報名您的活動 {event.name}，請儘速審核"
-            else:
-                message = f"更改的報名: {user.nickname} 已更改他在 {event.name} 的報名資訊，請儘速審核"
-
-            #notification = Notification.objects.create(user=event.created_by, message=message, event_id=event_id)
-            #send_notification_to_user(notification.id)
-            notify_user_about_event(event.created_by, event_id, '報名通知', message)
-
-            user_message = f"您已成功報名 {event.name}"
-            #user_notification = Notification.objects.create(user=user, message=user_message, event_id=event_id)
-            #send_notification_to_user(user_notification.id)
-            notify_user_about_event(user, event_id, '報名通知', user_message)
-
+        with transaction.atomic():
+            registration, created = Registration.objects.get_or_create(event=event, user=user)
+            # Lock it so a concurrent approval or edit sees this change and vice versa
+            registration = Registration.objects.select_for_update().get(pk=registration.pk)
+            #send_notification(user, "註冊成功！", f"您已經成功申請註冊 {event.name}")
+            serializer = RegistrationSerializer(data=request.data, instance=registration)
+            valid = serializer.is_valid()
+            if valid:
+                new_number_of_people = serializer.validated_data.get('number_of_people', registration.number_of_people)
+                approval = change_number_of_people(registration, new_number_of_people)
+                registration = serializer.save(**approval)
+                '''
+                if event.spots_left - registration.number_of_people < 0:
+                    return Response({"error": "Not enough spots left for this number of people."}, status=status.HTTP_400_BAD_REQUEST)
+                '''
+
+                # 创建新的通知
+                message = ""
+                if created:
+                    message = f"新的報名： {user.nickname} 已申請報名您的活動 {event.name}，請儘速審核"
+                else:
+                    message = f"更改的報名: {user.nickname} 已更改他在 {event.name} 的報名資訊，請儘速審核"
+
+                #notification = Notification.objects.create(user=event.created_by, message=message, event_id=event_id)
+                #send_notification_to_user(notification.id)
+                notify_user_about_event(event.created_by, event_id, '報名通知', message)
+
+                user_message = f"您已成功報名 {event.name}"
+                #user_notification = Notification.objects.create(user=user, message=user_message, event_id=event_id)
+                #send_notification_to_user(user_notification.id)
+                notify_user_about_event(user, event_id, '報名通知', user_message)
+
+        if valid:
             return Response(serializer.data, status=status.HTTP_200_OK)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -364,20 +376,20 @@ class UnregisterEventAPIView(APIView):
 
         event = get_object_or_404(Event, id=event_id)
         user = request.user
-        registration = get_object_or_404(Registration, event=event, user=user)
-        
-        # 只有当注册是已批准状态时才增加空位数量
-        if registration.is_approved:
-            event.spots_left += registration.number_of_people
-            event.save()
+        with transaction.atomic():
+            registration = get_object_or_404(Registration.objects.select_for_update(), event=event, user=user)
+
+            # 只有当注册是已批准状态时才增加空位数量
+            if registration.is_approved:
+                Event.release_spots(event.id, registration.number_of_people)
 
-        registration.delete()
+            registration.delete()
 
-        user_message = f"您已成功取消 {event.name} 的報名"
-        notify_user_about_event(user, event_id,'報名通知', user_message)
+            user_message = f"您已成功取消 {event.name} 的報名"
+            notify_user_about_event(user, event_id,'報名通知', user_message)
 
-        host_message = f"{user.nickname} 取消了他在 {event.name} 的報名"
-        notify_user_about_event(event.created_by, event_id, '報名通知', host_message)
+            host_message = f"{user.nickname} 取消了他在 {event.name} 的報名"
+            notify_user_about_event(event.created_by, event_id, '報名通知', host_message)
         return Response({"success": "Unregistered successfully."}, status=status.HTTP_200_OK)
 
 class CheckRegistrationAPIView(APIView):
@@ -403,11 +415,13 @@ class ActiveEventsListAPIView(generics.ListAPIView):
     """
     permission_classes = [AllowAny]
     serializer_class = EventSerializer
+    pagination_class = EventCursorPagination
+    filter_backends = [EventFilterBackend]
     #broadcast_new_event_notification_in_chunks.delay(2)
     def get_queryset(self):
         # Filter for open, waitlist, or playing
         statuses = ['open', 'waitlist', 'playing']
-        queryset = Event.objects.filter(status__in=statuses)
+        queryset = Event.objects.filter(status__in=statuses).select_related('created_by')
 
         # Optional: Exclude events from blocked users.
         """
@@ -420,15 +434,17 @@ class ActiveEventsListAPIView(generics.ListAPIView):
 
 class InactiveEventsListAPIView(generics.ListAPIView):
     """
-    Returns events whose status is one of: 'past', 'canceled'
+    Returns events whose status is one of: 'past', 'canceled', most recent first
     """
     permission_classes = [AllowAny]
     serializer_class = EventSerializer
+    pagination_class = InactiveEventCursorPagination
+    filter_backends = [EventFilterBackend]
 
     def get_queryset(self):
         # Filter for past or canceled
         statuses = ['past', 'canceled']
-        queryset = Event.objects.filter(status__in=statuses)
+        queryset = Event.objects.filter(status__in=statuses).select_related('created_by')
 
         # Optional: Exclude events from blocked users.
         """
@@ -0,0 +1,85 @@
+# notifications/chat.py
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from events.presence import present_user_ids
+from .outbox import notify_users
+
+CHAT_DIGEST_WINDOW = timedelta(seconds=getattr(settings, 'CHAT_DIGEST_WINDOW_SECONDS', 120))
+
+
+def chat_title(event):
+    return f"{event.name} - 新的聊天室通知"
+
+
+def chat_digest_message(event, count):
+    return f"{event.name} 有 {count} 則新訊息"
+
+
+def chat_recipient_ids(event, sender_id):
+    """Registrants and the host, without the sender, inactive users and users who blocked the sender."""
+    Registration = apps.get_model('events', 'Registration')
+    Block = apps.get_model('users', 'Block')
+    CustomUser = apps.get_model('users', 'CustomUser')
+
+    user_ids = set(Registration.objects.filter(event=event).values_list('user_id', flat=True))
+    user_ids.add(event.created_by_id)
+    user_ids.discard(sender_id)
+    blocked_sender = Block.objects.filter(blocker_id__in=user_ids, blocked_id=sender_id).values_list('blocker_id', flat=True)
+    return set(CustomUser.objects.filter(id__in=user_ids - set(blocked_sender), is_active=True).values_list('id', flat=True))
+
+
+def notify_chat_message(event_id, sender_id, message, recipient_ids=None):
+    """
+    Notifies the room about a new chat message. Users connected to the room already see it
+    and are skipped. Recipients whose window is closed get the message pushed immediately;
+    the rest only have their pending count raised, and flush_chat_digests sends them one
+    digest when their window ends.
+    """
+    Event = apps.get_model('events', 'Event')
+    ChatDigest = apps.get_model('notifications', 'ChatDigest')
+
+    event = Event.objects.get(id=event_id)
+    if recipient_ids is None:
+        recipient_ids = chat_recipient_ids(event, sender_id)
+    recipient_ids = set(recipient_ids) - present_user_ids(event_id)
+    if not recipient_ids:
+        return
+    now = timezone.now()
+
+    with transaction.atomic():
+        ChatDigest.objects.bulk_create(
+            [ChatDigest(event_id=event_id, user_id=user_id) for user_id in recipient_ids],
+            ignore_conflicts=True,
+        )
+        digests = list(ChatDigest.objects.select_for_update().filter(event_id=event_id, user_id__in=recipient_ids))
+
+        immediate, first_flush = [], None
+        for digest in digests:
+            if digest.pending_count == 0 and (digest.window_started_at is None or now - digest.window_started_at >= CHAT_DIGEST_WINDOW):
+                digest.window_started_at = now
+                immediate.append(digest.user_id)
+                continue
+            if digest.pending_count == 0:
+                digest.flush_at = digest.window_started_at + CHAT_DIGEST_WINDOW
+                first_flush = min(first_flush or digest.flush_at, digest.flush_at)
+            digest.pending_count += 1
+
+        ChatDigest.objects.bulk_update(digests, ['window_started_at', 'pending_count', 'flush_at'])
+        notify_users(immediate, chat_title(event), message, event_id=event_id)
+
+        if first_flush:
+            transaction.on_commit(lambda: schedule_digest_flush(first_flush))
+
+
+def schedule_digest_flush(eta):
+    from .tasks import flush_chat_digests
+    try:
+        flush_chat_digests.apply_async(eta=eta)
+    except Exception as e:
+        # The periodic flush picks the digests up anyway
+        print(f"[chat] Could not schedule digest flush: {e}")
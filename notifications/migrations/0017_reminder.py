@@ -0,0 +1,30 @@
+# Generated by Django 4.2.14 on 2026-10-18 20:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0029_event_starts_at_ends_at'),
+        ('notifications', '0016_delete_customfcmdevice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offset', models.DurationField()),
+                ('due_at', models.DateTimeField()),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('skipped', 'Skipped'), ('canceled', 'Canceled')], default='pending', max_length=20)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='events.event')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('state', 'pending')), fields=['due_at'], name='reminder_pending_due_idx')],
+                'unique_together': {('event', 'offset')},
+            },
+        ),
+    ]
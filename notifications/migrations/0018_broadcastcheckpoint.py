@@ -0,0 +1,32 @@
+# Generated by Django 4.2.14 on 2026-10-18 20:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0029_event_starts_at_ends_at'),
+        ('notifications', '0017_reminder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BroadcastCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('audience', models.CharField(max_length=20)),
+                ('last_user_id', models.BigIntegerField(default=0)),
+                ('last_device_id', models.BigIntegerField(default=0)),
+                ('users_notified', models.IntegerField(default=0)),
+                ('pushes_sent', models.IntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='broadcast_checkpoints', to='events.event')),
+            ],
+            options={
+                'unique_together': {('event', 'audience')},
+            },
+        ),
+    ]
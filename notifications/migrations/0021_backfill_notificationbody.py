@@ -0,0 +1,58 @@
+# Generated by Django 4.2.14 on 2026-10-18 20:40
+
+from django.db import migrations, transaction
+
+
+BATCH_SIZE = 2000
+
+
+def backfill_bodies(apps, schema_editor):
+    NotificationBody = apps.get_model('notifications', 'NotificationBody')
+    Notification = apps.get_model('notifications', 'Notification')
+    NotificationOutbox = apps.get_model('notifications', 'NotificationOutbox')
+
+    # One shared body per distinct (title, message); the same text sent twice ends up on one row.
+    # Rows are walked in pk batches, each committed on its own, so no scan per text and no
+    # table-wide lock for the whole run. An interrupted run resumes at the rows still without body.
+    bodies = {}
+    for model in (Notification, NotificationOutbox):
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                rows = list(
+                    model.objects.filter(body__isnull=True, id__gt=last_id)
+                    .order_by('id').only('id', 'title', 'message')[:BATCH_SIZE]
+                )
+                if not rows:
+                    break
+                new_texts = list(dict.fromkeys((row.title, row.message) for row in rows if (row.title, row.message) not in bodies))
+                created = NotificationBody.objects.bulk_create([
+                    NotificationBody(title=title, message=message) for title, message in new_texts
+                ])
+                bodies.update(zip(new_texts, (body.id for body in created)))
+                for row in rows:
+                    row.body_id = bodies[(row.title, row.message)]
+                model.objects.bulk_update(rows, ['body'])
+                last_id = rows[-1].id
+
+
+def restore_text(apps, schema_editor):
+    NotificationBody = apps.get_model('notifications', 'NotificationBody')
+    Notification = apps.get_model('notifications', 'Notification')
+    NotificationOutbox = apps.get_model('notifications', 'NotificationOutbox')
+
+    for body in NotificationBody.objects.iterator():
+        for model in (Notification, NotificationOutbox):
+            model.objects.filter(body=body).update(title=body.title, message=body.message)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('notifications', '0020_notificationbody'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_bodies, restore_text),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.14 on 2026-10-18 20:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0021_backfill_notificationbody'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='notification',
+            name='title',
+        ),
+        migrations.RemoveField(
+            model_name='notification',
+            name='message',
+        ),
+        migrations.RemoveField(
+            model_name='notificationoutbox',
+            name='title',
+        ),
+        migrations.RemoveField(
+            model_name='notificationoutbox',
+            name='message',
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='body',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='notifications.notificationbody'),
+        ),
+        migrations.AlterField(
+            model_name='notificationoutbox',
+            name='body',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='notifications.notificationbody'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.14 on 2026-10-18 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0022_remove_notification_text'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='notification_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['user'], name='notification_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scheduledreminder',
+            index=models.Index(fields=['event_id'], name='sched_reminder_event_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scheduledreminder',
+            index=models.Index(fields=['task_id'], name='sched_reminder_task_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.14 on 2026-10-18 20:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('events', '0030_hot_lookup_indexes'),
+        ('notifications', '0023_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatDigest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window_started_at', models.DateTimeField(blank=True, null=True)),
+                ('pending_count', models.IntegerField(default=0)),
+                ('flush_at', models.DateTimeField(blank=True, null=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_digests', to='events.event')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('pending_count__gt', 0)), fields=['flush_at'], name='chatdigest_due_idx')],
+                'unique_together': {('event', 'user')},
+            },
+        ),
+    ]
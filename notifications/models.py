@@ -20,23 +20,167 @@ class ScheduledReminder(models.Model):
     #created_at = models.DateTimeField(auto_now_add=True)  # When the notification was scheduled
     updated_at = models.DateTimeField(auto_now=True)  # Last time the record was updated
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['event_id'], name='sched_reminder_event_idx'),
+            models.Index(fields=['task_id'], name='sched_reminder_task_idx'),
+        ]
+
     def __str__(self):
         return f"Notification for event {self.event.id} scheduled at {self.scheduled_time}"
 
 
+class Reminder(models.Model):
+    """
+    One row per (event, offset) reminder. dispatch_due_reminders claims due rows every minute,
+    so moving an event only updates due_at instead of revoking and re-enqueueing Celery tasks.
+    """
+    STATE_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('skipped', 'Skipped'),  # Due time had already passed when (re)scheduled or dispatched
+        ('canceled', 'Canceled'),
+    ]
+    event = models.ForeignKey(Event, related_name='reminders', on_delete=models.CASCADE)
+    offset = models.DurationField()  # How long before the event starts
+    due_at = models.DateTimeField()
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default='pending')
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('event', 'offset')
+        indexes = [
+            models.Index(fields=['due_at'], condition=models.Q(state='pending'), name='reminder_pending_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Reminder for event {self.event_id} due at {self.due_at} ({self.state})"
+
+
+class NotificationOutbox(models.Model):
+    """
+    A push waiting to be delivered. Written in the same transaction as the Notification it
+    belongs to, then sent in batches by drain_notification_outbox so requests never wait on FCM.
+    """
+    STATE_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('no_device', 'No device'),
+        ('failed', 'Failed'),  # Gave up after NOTIFICATION_OUTBOX_MAX_ATTEMPTS
+    ]
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    notification = models.ForeignKey('Notification', null=True, blank=True, on_delete=models.CASCADE)
+    body = models.ForeignKey('NotificationBody', on_delete=models.CASCADE)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at'], condition=models.Q(state='pending'), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"Push to {self.user_id}: body {self.body_id} ({self.state})"
+
+
+class ChatDigest(models.Model):
+    """
+    Chat notification state of one recipient in one event room. The first message after a
+    quiet period is pushed right away and opens a window; messages inside the window are only
+    counted and go out as one digest when flush_chat_digests runs at flush_at.
+    """
+    event = models.ForeignKey(Event, related_name='chat_digests', on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    window_started_at = models.DateTimeField(null=True, blank=True)  # Last push to this user about this room
+    pending_count = models.IntegerField(default=0)  # Messages folded since then
+    flush_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('event', 'user')
+        indexes = [
+            models.Index(fields=['flush_at'], condition=models.Q(pending_count__gt=0), name='chatdigest_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Chat digest for {self.user_id} in event {self.event_id}: {self.pending_count} pending"
+
+
+class BroadcastCheckpoint(models.Model):
+    """
+    Progress of a new-event broadcast. The broadcast walks devices in (user_id, id) order
+    and stores the last one pushed, so a restarted worker resumes instead of re-sending.
+    """
+    event = models.ForeignKey(Event, related_name='broadcast_checkpoints', on_delete=models.CASCADE)
+    audience = models.CharField(max_length=20)
+    last_user_id = models.BigIntegerField(default=0)
+    last_device_id = models.BigIntegerField(default=0)
+    users_notified = models.IntegerField(default=0)
+    pushes_sent = models.IntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('event', 'audience')
+
+    def __str__(self):
+        return f"Broadcast of event {self.event_id} to {self.audience} at user {self.last_user_id}"
+
+
 #class CustomFCMDevice(GCMDevice):
 #    custom_user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
 
+class NotificationBody(models.Model):
+    """Title and text shared by every recipient of one fan-out."""
+    title = models.CharField(max_length=255, null=True, blank=True)
+    message = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.title} - {self.message}"
+
+
 class Notification(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     event_id = models.IntegerField(null=True)
-    title = task_id = models.CharField(max_length=255, null=True, blank=True)
-    message = models.TextField()
+    body = models.ForeignKey(NotificationBody, related_name='notifications', on_delete=models.CASCADE)
     is_read = models.BooleanField(default=False)
     timestamp = models.DateTimeField(auto_now_add=True)
     #is_celery_task = models.BooleanField(default=False)  # New field
     task_id = models.CharField(max_length=255, null=True, blank=True)  # To store Celery task ID if applicable
 
+    class Meta:
+        indexes = [
+            # Inbox pages are (-timestamp, -id) keyset scans per user
+            models.Index(fields=['user', '-timestamp', '-id'], name='notification_inbox_idx'),
+            models.Index(fields=['user'], condition=models.Q(is_read=False), name='notification_unread_idx'),
+        ]
+
+    @property
+    def title(self):
+        return self.body.title
+
+    @property
+    def message(self):
+        return self.body.message
+
     def __str__(self):
         return f"Notification for {self.user.username} - {self.message}"
 
+
+class ArchivedNotification(models.Model):
+    """
+    Read notifications older than NOTIFICATION_RETENTION_DAYS, moved out of the inbox table
+    by archive_old_notifications so the hot table and its indexes stay small.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    event_id = models.IntegerField(null=True)
+    body = models.ForeignKey(NotificationBody, related_name='archived_notifications', on_delete=models.CASCADE)
+    timestamp = models.DateTimeField()  # When the original notification was created
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived notification for {self.user_id} from {self.timestamp}"
+
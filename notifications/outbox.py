@@ -0,0 +1,84 @@
+# notifications/outbox.py
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.apps import apps
+from django.db import transaction
+from django.db.models import F
+
+# Rows written per bulk_create when fanning a notification out to many users
+FANOUT_BATCH_SIZE = 500
+
+
+def notify_users(user_ids, title, message, event_id=None, store=True, batch_size=FANOUT_BATCH_SIZE):
+    """
+    Queues a push for every user in `user_ids`. The text is stored once in a NotificationBody
+    shared by all recipients. With store=True a Notification row is written
+    for each user as well, in the same transaction as its outbox entry. Rows are built in memory
+    and written with bulk_create, `batch_size` at a time. Nothing is sent here:
+    drain_notification_outbox delivers the entries once the transaction has committed.
+    """
+    # Dynamically load the models: events.models imports the tasks, which import this module
+    NotificationBody = apps.get_model('notifications', 'NotificationBody')
+    Notification = apps.get_model('notifications', 'Notification')
+    CustomUser = apps.get_model('users', 'CustomUser')
+    NotificationOutbox = apps.get_model('notifications', 'NotificationOutbox')
+
+    # Keep the first occurrence, e.g. a host who also registered for their own event
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return
+    with transaction.atomic():
+        body = NotificationBody.objects.create(title=title, message=message)
+        for start in range(0, len(user_ids), batch_size):
+            chunk = user_ids[start:start + batch_size]
+            notifications = [None] * len(chunk)
+            if store:
+                notifications = Notification.objects.bulk_create([
+                    Notification(user_id=user_id, body=body, event_id=event_id)
+                    for user_id in chunk
+                ])
+                CustomUser.objects.filter(id__in=chunk).update(unread_notifications=F('unread_notifications') + 1)
+            NotificationOutbox.objects.bulk_create([
+                NotificationOutbox(user_id=user_id, notification=notification, body=body)
+                for user_id, notification in zip(chunk, notifications)
+            ])
+        transaction.on_commit(kick_drainer)
+
+
+def kick_drainer():
+    from .tasks import drain_notification_outbox
+    try:
+        # Runs in the request's on_commit: fail fast instead of waiting out broker retries
+        drain_notification_outbox.apply_async(retry=False)
+    except Exception as e:
+        # The periodic drain picks the entries up anyway
+        print(f"[outbox] Could not queue drain task: {e}")
+
+
+def push_live_notifications(entries):
+    """
+    Hands stored notifications of outbox entries to the recipients' open ws/live/ sockets
+    (their personal channel layer group), serialised like NotificationListView. Users
+    without a live socket simply have an empty group.
+    """
+    from users.blocks import user_group_name
+    from .serializers import NotificationSerializer
+
+    channel_layer = get_channel_layer()
+    messages = []
+    for entry in entries:
+        if entry.notification is None:
+            continue
+        entry.notification.body = entry.body  # Shared by the batch, saves a query per entry
+        messages.append((user_group_name(entry.user_id), NotificationSerializer(entry.notification).data))
+    if channel_layer is None or not messages:
+        return
+
+    async def send_all():
+        for group, notification in messages:
+            await channel_layer.group_send(group, {'type': 'notification.created', 'notification': notification})
+
+    try:
+        async_to_sync(send_all)()
+    except Exception as e:
+        print(f"[outbox] Live notification push failed: {e}")
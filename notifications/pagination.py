@@ -0,0 +1,8 @@
+# notifications/pagination.py
+from events.pagination import KeysetCursorPagination
+
+
+class NotificationCursorPagination(KeysetCursorPagination):
+    """Inbox, newest first."""
+    ordering = ('-timestamp', '-id')
+    page_size = 20
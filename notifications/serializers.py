@@ -23,6 +23,9 @@ class EventSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'location', 'date', 'start_time', 'end_time']  # Include relevant fields
 
 class NotificationSerializer(serializers.ModelSerializer):
+    title = serializers.CharField(source='body.title', read_only=True)
+    message = serializers.CharField(source='body.message', read_only=True)
+
     class Meta:
         model = Notification
         fields = ['id', 'message', 'is_read', 'event_id', 'timestamp', 'title']
@@ -1,145 +1,368 @@
 from celery import shared_task
 from django.apps import apps
-from .utils import send_notification
-import datetime
+from .chat import chat_digest_message, chat_title, notify_chat_message
+from .outbox import notify_users, push_live_notifications
+from .utils import FCM_MULTICAST_LIMIT, send_notification_to_users, send_to_devices
+import time
 from datetime import timedelta
 from volleyball_app.celery import app as celery_app
 from django.apps import apps
 from django.utils import timezone
-from django.db import models
-from django.contrib.auth import get_user_model
+from django.db import models, transaction
+from django.conf import settings
+
+# Offset before the event start -> text inserted into the reminder message
+REMINDER_LABELS = {
+    timedelta(hours=24): " 再 24 小時",
+    timedelta(hours=1): " 再 1 小時",
+    timedelta(minutes=30): " 再 30 分鐘",
+    timedelta(seconds=0): "",
+}
+# Reminders the dispatcher picks up later than this are dropped instead of sent
+REMINDER_MAX_LATENESS = timedelta(minutes=30)
+# Outbox delivery: entries per batch, attempts before giving up, first retry delay (doubles each time)
+OUTBOX_BATCH_SIZE = getattr(settings, 'NOTIFICATION_OUTBOX_BATCH_SIZE', 500)
+OUTBOX_MAX_ATTEMPTS = getattr(settings, 'NOTIFICATION_OUTBOX_MAX_ATTEMPTS', 5)
+OUTBOX_RETRY_SECONDS = getattr(settings, 'NOTIFICATION_OUTBOX_RETRY_SECONDS', 30)
+# A claimed entry whose worker died before recording the result is picked up again after this
+OUTBOX_CLAIM_SECONDS = getattr(settings, 'NOTIFICATION_OUTBOX_CLAIM_SECONDS', 300)
+NOTIFICATION_RETENTION_DAYS = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 90)
 
 def schedule_event_status_updates(event, is_overnight=False):
-    ScheduledReminder = apps.get_model('notifications', 'ScheduledReminder')
+    """
+    Brings a newly created or edited event's status in line with its start and end time.
+    The later open -> playing -> past transitions are made by sweep_event_statuses.
+    """
     now = timezone.now()
 
-    event_start_datetime = timezone.make_aware(
-        datetime.datetime.combine(event.date, event.start_time)
-    )
-
     if event.status == 'canceled':
         return
-        
-    # Adjust the end date for overnight events
-    end_date = event.date + timedelta(days=1) if is_overnight else event.date
 
-    event_end_datetime = timezone.make_aware(
-        datetime.datetime.combine(end_date, event.end_time)
-    )
-
-    if now >= event_end_datetime:
-        event.status = 'past'
-        event.save()
-    elif now >= event_start_datetime:
-        event.status = 'playing'
-        event.save()
-
-        task_past = set_event_status.apply_async((event.id, 'past'), eta=event_end_datetime)
-        ScheduledReminder.objects.create(event_id=event.id, task_id=task_past.id)
+    if now >= event.ends_at:
+        new_status = 'past'
+    elif now >= event.starts_at:
+        new_status = 'playing'
+    elif event.status not in ('open', 'waitlist'):
+        # e.g. a past event that was moved to a later date
+        new_status = 'open' if event.spots_left > 0 else 'waitlist'
     else:
-        event.status = 'open'
-        event.save()
-
-        task_playing = set_event_status.apply_async((event.id, 'playing'), eta=event_start_datetime)
-        task_past = set_event_status.apply_async((event.id, 'past'), eta=event_end_datetime)
+        return
 
-        ScheduledReminder.objects.create(event_id=event.id, task_id=task_playing.id)
-        ScheduledReminder.objects.create(event_id=event.id, task_id=task_past.id)
+    event.status = new_status
+    event.save(update_fields=['status'])
 
-def schedule_reminders(event, is_overnight=False):
-    ScheduledReminder = apps.get_model('notifications', 'ScheduledReminder')
-
-    event_start_datetime = timezone.make_aware(
-        datetime.datetime.combine(event.date, event.start_time)
-    )
+def advance_event_statuses(queryset, now=None):
+    """
+    Moves every event in `queryset` whose end / start time has passed to 'past' / 'playing',
+    one bulk UPDATE per status. Running it late or twice is harmless: each UPDATE only
+    matches rows that are due and have not moved yet. Returns the number of rows moved.
+    """
+    now = now or timezone.now()
+    # Finish events first, so an event that ended since the last run goes straight to 'past'
+    to_past = queryset.filter(status__in=['open', 'waitlist', 'playing'], ends_at__lte=now).update(status='past')
+    to_playing = queryset.filter(status__in=['open', 'waitlist'], starts_at__lte=now).update(status='playing')
+    return {'playing': to_playing, 'past': to_past}
 
-    # Adjust the reminder times if the event spans multiple days
-    if is_overnight:
-        print(f"Scheduling reminders for overnight event: {event.name}")
+@shared_task
+def sweep_event_statuses():
+    """Periodic (celery beat) replacement for the per-event status ETA tasks."""
+    Event = apps.get_model('events', 'Event')
+    started = timezone.now()
+    moved = advance_event_statuses(Event.objects.all(), now=started)
+    elapsed_ms = (timezone.now() - started).total_seconds() * 1000
+    print(f"[status sweep] {moved['playing']} events -> playing, {moved['past']} events -> past in {elapsed_ms:.0f} ms")
+    return moved
 
-    reminder_times = {
-        " 再 24 小時": timedelta(hours=24),
-        " 再 1 小時": timedelta(hours=1),
-        " 再 30 分鐘": timedelta(minutes=30),
-        "": timedelta(seconds=0)
-    }
+def schedule_reminders(event, is_overnight=False):
+    """
+    Creates or moves the event's Reminder rows; dispatch_due_reminders sends them.
+    Rows whose due time did not change are left alone, so sent reminders are not repeated.
+    """
+    Reminder = apps.get_model('notifications', 'Reminder')
 
     current_time = timezone.now()
+    existing = {reminder.offset: reminder for reminder in Reminder.objects.filter(event=event)}
 
-    for label, delta in reminder_times.items():
-        reminder_time = event_start_datetime - delta
+    for offset, label in REMINDER_LABELS.items():
+        due_at = event.starts_at - offset
+        reminder = existing.get(offset)
+        if reminder and reminder.due_at == due_at and reminder.state != 'canceled':
+            continue
 
-        if reminder_time >= current_time:
-            result = celery_app.send_task(
-                'notifications.tasks.remind_users_before_event',
-                args=[event.id, label],
-                eta=reminder_time,
-            )
-            ScheduledReminder.objects.create(event_id=event.id, task_id=result.id)
-        else:
+        state = 'pending' if due_at >= current_time else 'skipped'
+        if state == 'skipped':
             print(f"Skipping reminder '{label}' for event {event.id} because it is in the past.")
-            
+        if reminder:
+            Reminder.objects.filter(pk=reminder.pk).update(due_at=due_at, state=state, sent_at=None)
+        else:
+            Reminder.objects.create(event=event, offset=offset, due_at=due_at, state=state)
+
+
 def cancel_old_notifications(event):
     """
     Cancels all old scheduled notifications for the given event.
     """
     ScheduledReminder = apps.get_model('notifications', 'ScheduledReminder')
+    Reminder = apps.get_model('notifications', 'Reminder')
+
+    Reminder.objects.filter(event_id=event.id, state='pending').update(state='canceled')
+
+    # Celery ETA tasks scheduled before reminders moved to the Reminder table:
+    # one revoke broadcast for all of them and one DELETE
     reminders = ScheduledReminder.objects.filter(event_id=event.id)
+    task_ids = list(reminders.values_list('task_id', flat=True))
+    if task_ids:
+        celery_app.control.revoke(task_ids, terminate=True)
+        reminders.delete()
+
+@shared_task
+def sweep_orphan_reminders(keep_days=7):
+    """
+    Runs hourly from celery beat. Deletes legacy ScheduledReminder rows whose event is gone
+    (revoking their tasks) or has already started, so their task has run or no longer matters,
+    and finished Reminder rows of events that started more than `keep_days` ago.
+    """
+    Event = apps.get_model('events', 'Event')
+    ScheduledReminder = apps.get_model('notifications', 'ScheduledReminder')
+    Reminder = apps.get_model('notifications', 'Reminder')
+    now = timezone.now()
+
+    orphans = ScheduledReminder.objects.filter(
+        models.Q(event_id__isnull=True) | ~models.Exists(Event.objects.filter(pk=models.OuterRef('event_id')))
+    )
+    task_ids = list(orphans.values_list('task_id', flat=True))
+    if task_ids:
+        celery_app.control.revoke(task_ids, terminate=True)
+    deleted_orphans = orphans.delete()[0]
+
+    started = Event.objects.filter(pk=models.OuterRef('event_id'), starts_at__lt=now)
+    deleted_started = ScheduledReminder.objects.filter(models.Exists(started)).delete()[0]
 
-    for reminder in reminders:
-        # Revoke the Celery task using its task ID  
-        celery_app.control.revoke(reminder.task_id, terminate=True)
+    deleted_finished = Reminder.objects.exclude(state='pending').filter(
+        event__starts_at__lt=now - timedelta(days=keep_days)
+    ).delete()[0]
 
-        # Delete the reminder record from the database
-        reminder.delete()
+    print(
+        f"[reminders] swept {deleted_orphans} orphaned and {deleted_started} stale legacy reminders, "
+        f"{deleted_finished} finished reminders"
+    )
+    return deleted_orphans + deleted_started + deleted_finished
 
 @shared_task
 def set_event_status(event_id, status):
+    """
+    Only kept so ETA tasks queued before sweep_event_statuses existed still drain.
+    Applies whatever transition is due for the event, however late the task runs.
+    """
     Event = apps.get_model('events', 'Event')
-    try:
-        event = Event.objects.get(pk=event_id)
-        if event.status == 'canceled':
-            return
+    advance_event_statuses(Event.objects.filter(pk=event_id))
 
-        now = timezone.now()
+@shared_task
+def dispatch_due_reminders(batch_size=100):
+    """
+    Runs every minute from celery beat. Claims due pending reminders in batches with
+    SELECT ... FOR UPDATE SKIP LOCKED, so several workers can dispatch side by side.
+    """
+    Reminder = apps.get_model('notifications', 'Reminder')
+    now = timezone.now()
+    counts = {'sent': 0, 'skipped': 0, 'canceled': 0}
+
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Reminder.objects.select_for_update(skip_locked=True, of=('self',))
+                .filter(state='pending', due_at__lte=now)
+                .select_related('event', 'event__created_by')
+                .order_by('due_at')[:batch_size]
+            )
+            if not batch:
+                break
 
-        # Calculate event's start and end datetime
-        event_start_datetime = timezone.make_aware(
-            datetime.datetime.combine(event.date, event.start_time)
-        )
-        end_date = event.date + timedelta(days=1) if event.is_overnight else event.date
-        event_end_datetime = timezone.make_aware(
-            datetime.datetime.combine(end_date, event.end_time)
-        )
+            for reminder in batch:
+                if reminder.event.status == 'canceled':
+                    reminder.state = 'canceled'
+                elif now - reminder.due_at > REMINDER_MAX_LATENESS:
+                    reminder.state = 'skipped'
+                else:
+                    send_event_reminder(reminder.event, REMINDER_LABELS.get(reminder.offset, ''))
+                    reminder.state = 'sent'
+                    reminder.sent_at = timezone.now()
+                counts[reminder.state] += 1
 
-        # Add leeway (±10 seconds)
-        leeway = timedelta(seconds=10)
+            Reminder.objects.bulk_update(batch, ['state', 'sent_at'])
 
-        # Check if the current time is within the leeway range
-        if status == 'playing' and not (event_start_datetime - leeway <= now <= event_start_datetime + leeway):
-            print(f"Skipping status update to 'playing' for Event ID {event_id} due to time mismatch.")
-            return
-        if status == 'past' and not (event_end_datetime - leeway <= now <= event_end_datetime + leeway):
-            print(f"Skipping status update to 'past' for Event ID {event_id} due to time mismatch.")
-            return
+    print(f"[reminders] sent {counts['sent']}, skipped {counts['skipped']}, canceled {counts['canceled']}")
+    return counts
 
-        # Update status if the timing is valid
-        event.status = status
-        event.save()
+@shared_task
+def drain_notification_outbox(batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Delivers pending NotificationOutbox entries. Queued after every commit that writes
+    entries and every 10 seconds from celery beat. Entries sharing a NotificationBody
+    go out as one batched multicast; failed pushes are retried with exponential backoff.
+    Stored notifications are also pushed to the recipients' live sockets.
+    A batch is claimed in one short transaction (attempt counted, next_attempt_at moved
+    OUTBOX_CLAIM_SECONDS ahead), sent with no transaction or row lock held, and its
+    results are recorded in a second short transaction.
+    """
+    NotificationOutbox = apps.get_model('notifications', 'NotificationOutbox')
+    now = timezone.now()
+    counts = {'sent': 0, 'no_device': 0, 'retry': 0, 'failed': 0}
+
+    while True:
+        with transaction.atomic():
+            batch = list(
+                NotificationOutbox.objects.select_for_update(skip_locked=True, of=('self',))
+                .filter(state='pending', next_attempt_at__lte=now)
+                .select_related('body', 'notification')
+                .order_by('next_attempt_at', 'id')[:batch_size]
+            )
+            if not batch:
+                break
+            # Open ws/live/ sockets get the notification once, on the first attempt
+            first_attempts = [entry for entry in batch if entry.attempts == 0]
+            for entry in batch:
+                entry.attempts += 1
+                entry.next_attempt_at = now + timedelta(seconds=OUTBOX_CLAIM_SECONDS)
+            NotificationOutbox.objects.bulk_update(batch, ['attempts', 'next_attempt_at'])
+
+        push_live_notifications(first_attempts)
+        groups = {}
+        for entry in batch:
+            groups.setdefault(entry.body_id, []).append(entry)
+
+        for entries in groups.values():
+            body = entries[0].body
+            results = send_notification_to_users([entry.user_id for entry in entries], body.title, body.message)
+            for entry in entries:
+                result = results.get(entry.user_id, 'failed')
+                if result in ('sent', 'no_device'):
+                    entry.state = result
+                    entry.sent_at = timezone.now()
+                elif entry.attempts >= OUTBOX_MAX_ATTEMPTS:
+                    entry.state = 'failed'
+                else:
+                    delay = OUTBOX_RETRY_SECONDS * 2 ** (entry.attempts - 1)
+                    entry.next_attempt_at = now + timedelta(seconds=delay)
+                counts[entry.state if entry.state != 'pending' else 'retry'] += 1
+
+        NotificationOutbox.objects.bulk_update(batch, ['state', 'next_attempt_at', 'sent_at'])
+
+    if any(counts.values()):
+        print(f"[outbox] sent {counts['sent']}, no device {counts['no_device']}, retry {counts['retry']}, failed {counts['failed']}")
+    return counts
 
+@shared_task
+def send_chat_notifications(event_id, sender_id, message):
+    """Recipient lookup and push fan-out for one chat message, off the WebSocket path."""
+    Event = apps.get_model('events', 'Event')
+    try:
+        notify_chat_message(event_id, sender_id, message)
     except Event.DoesNotExist:
-        print(f'Event with id {event_id} does not exist.')
+        print(f"Event with id {event_id} does not exist.")
 
 @shared_task
-def remind_users_before_event(event_id, timedelta_before_event):
+def flush_chat_digests(batch_size=500):
+    """
+    Sends the "N new messages" digests whose window has ended. Scheduled for the end of
+    each window by notify_chat_message, and run every minute from celery beat as a safety net.
+    A flush starts a new window, so a busy room pushes each user at most once per window.
+    """
+    ChatDigest = apps.get_model('notifications', 'ChatDigest')
+    now = timezone.now()
+    flushed = 0
+
+    while True:
+        with transaction.atomic():
+            batch = list(
+                ChatDigest.objects.select_for_update(skip_locked=True, of=('self',))
+                .filter(pending_count__gt=0, flush_at__lte=now)
+                .select_related('event')
+                .order_by('flush_at')[:batch_size]
+            )
+            if not batch:
+                break
+
+            groups = {}
+            for digest in batch:
+                groups.setdefault((digest.event_id, digest.pending_count), []).append(digest)
+            for digests in groups.values():
+                event, count = digests[0].event, digests[0].pending_count
+                notify_users([digest.user_id for digest in digests], chat_title(event), chat_digest_message(event, count), event_id=event.id)
+
+            for digest in batch:
+                digest.pending_count = 0
+                digest.flush_at = None
+                digest.window_started_at = now
+            ChatDigest.objects.bulk_update(batch, ['pending_count', 'flush_at', 'window_started_at'])
+            flushed += len(batch)
+
+    if flushed:
+        print(f"[chat] flushed {flushed} digests")
+    return flushed
 
-    Event = apps.get_model('events', 'Event')
-    Registration = apps.get_model('events', 'Registration')
+@shared_task
+def archive_old_notifications(days=NOTIFICATION_RETENTION_DAYS, batch_size=1000):
+    """
+    Runs nightly from celery beat. Moves read notifications older than `days` to
+    ArchivedNotification and deletes delivered outbox entries of the same age, one
+    short transaction per batch so the inbox table is never locked for long.
+    """
     Notification = apps.get_model('notifications', 'Notification')
+    ArchivedNotification = apps.get_model('notifications', 'ArchivedNotification')
+    NotificationOutbox = apps.get_model('notifications', 'NotificationOutbox')
+    cutoff = timezone.now() - timedelta(days=days)
+
+    deleted_entries = 0
+    while True:
+        ids = list(
+            NotificationOutbox.objects.filter(created_at__lt=cutoff).exclude(state='pending')
+            .order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        deleted_entries += NotificationOutbox.objects.filter(id__in=ids).delete()[0]
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Notification.objects.select_for_update(skip_locked=True)
+                .filter(is_read=True, timestamp__lt=cutoff)
+                .order_by('id').values('id', 'user_id', 'event_id', 'body_id', 'timestamp')[:batch_size]
+            )
+            if not rows:
+                break
+            ArchivedNotification.objects.bulk_create([
+                ArchivedNotification(user_id=row['user_id'], event_id=row['event_id'], body_id=row['body_id'], timestamp=row['timestamp'])
+                for row in rows
+            ])
+            Notification.objects.filter(id__in=[row['id'] for row in rows]).delete()
+            archived += len(rows)
+
+    print(f"[retention] archived {archived} notifications, deleted {deleted_entries} outbox entries older than {days} days")
+    return archived
+
+def send_event_reminder(event, timedelta_before_event):
+    """Reminds the host and every approved registrant that the event is about to start."""
+    Registration = apps.get_model('events', 'Registration')
+
+    print(f'Reminding users about event {event.id}')
+
+    message = f'{event.name}{timedelta_before_event} 就要開始了!'
+    # The event creator plus every approved registrant
+    user_ids = [event.created_by_id] + list(
+        Registration.objects.filter(event=event, is_approved=True).values_list('user_id', flat=True)
+    )
+    notify_users(user_ids, '活動提醒', message, event_id=event.id)
+    print(f"Queued reminders for {len(user_ids)} users about event {event.id}")
+
+@shared_task
+def remind_users_before_event(event_id, timedelta_before_event):
+    """Legacy ETA task, superseded by the Reminder table and dispatch_due_reminders."""
+    Event = apps.get_model('events', 'Event')
     ScheduledReminder = apps.get_model('notifications', 'ScheduledReminder')
     
-    print(f'Reminding users about event {event_id}')
-    
     try:
         # Fetch the event
         event = Event.objects.get(id=event_id)
@@ -147,27 +370,8 @@ def remind_users_before_event(event_id, timedelta_before_event):
         if event.status == 'canceled':
             print(f'Event {event_id} is canceled. No notifications will be sent.')
             return
-        # Fetch the registrations
-        registrations = Registration.objects.filter(event=event, is_approved=True)
-        # Notify the event creator
-        notify_user_about_event(event.created_by, event_id, f'{event.name} {timedelta_before_event} 就要開始了!')
-        notification = Notification.objects.create(
-            user=event.created_by,
-            title='活動提醒',
-            message=f'{event.name}{timedelta_before_event} 就要開始了!',
-            event_id=event_id
-        )
-        # Notify other users
-        for registration in registrations:
-            user = registration.user
-            notification = Notification.objects.create(
-                user=user,
-                title='活動提醒',
-                message=f'{event.name}{timedelta_before_event} 就要開始了!',
-                event_id=event_id
-            )
-            notify_user_about_event(user, event_id, f'{event.name}{timedelta_before_event} 就要開始了!')
-            print(f'Notifying user {user.id} about event {event_id}')
+
+        send_event_reminder(event, timedelta_before_event)
         
         try:
             # Find the reminder by task_id (need to get the current task id)
@@ -180,21 +384,20 @@ def remind_users_before_event(event_id, timedelta_before_event):
     except Event.DoesNotExist:
         print(f'Event with id {event_id} does not exist.')
 
-def notify_user_about_event(user, event_id, message):
-    # Create the notification
-    send_notification(user, "活動提醒", message) 
-
-CustomUser = get_user_model()
 
 @shared_task
-def broadcast_new_event_notification_in_chunks(event_id, chunk_size=300):
+def broadcast_new_event_notification_in_chunks(event_id, chunk_size=300, audience='all'):
     """
-    Sends a notification about a newly created event to ALL users
-    in CHUNKS to avoid performance issues with very large queries.
+    Sends a notification about a newly created event to every user with an active device,
+    walking FCMDevice in (user_id, id) keyset order so each chunk costs the same.
+    Every chunk is one multicast request. audience='city' only reaches users whose
+    preferred_city matches event.city. Progress is stored in BroadcastCheckpoint, so a
+    restarted task continues after the last chunk that went out.
     """
     # Dynamically load the models to avoid circular imports
     Event = apps.get_model('events', 'Event')
-    Notification = apps.get_model('notifications', 'Notification')
+    BroadcastCheckpoint = apps.get_model('notifications', 'BroadcastCheckpoint')
+    FCMDevice = apps.get_model('fcm_django', 'FCMDevice')
 
     # 1. Fetch the event
     try:
@@ -203,28 +406,53 @@ def broadcast_new_event_notification_in_chunks(event_id, chunk_size=300):
         print(f"Event with id {event_id} does not exist.")
         return
 
+    checkpoint, _ = BroadcastCheckpoint.objects.get_or_create(event=event, audience=audience)
+    if checkpoint.completed_at:
+        print(f"Broadcast of event {event_id} to '{audience}' already completed.")
+        return
+
     # 2. Prepare the notification content
     title_msg = "新活動創立通知"
     body_msg = f"活動 '{event.name}' 已創建，快來看看吧！"
 
-    # 3. Get all users (or filter if you only want a subset)
-    all_users = CustomUser.objects.exclude(pk=event.created_by_id)
-    total_users = all_users.count()
-
-    offset = 0
-    notified_count = 0
+    # 3. Devices of the target audience, never the creator
+    devices = FCMDevice.objects.filter(active=True, user__is_active=True).exclude(user_id=event.created_by_id)
+    if audience == 'city':
+        devices = devices.filter(user__preferred_city=event.city)
+    devices = devices.order_by('user_id', 'id')
+    chunk_size = min(chunk_size, FCM_MULTICAST_LIMIT)
 
-    # 4. Iterate over users in slices of 'chunk_size'
-    while offset < total_users:
-        chunk = all_users[offset : offset + chunk_size]
-        for user in chunk:
-            send_notification(user, title_msg, body_msg)
-            notified_count += 1
-            print(user.nickname)
-
-        offset += chunk_size
+    started = time.perf_counter()
+    users_notified = pushes_sent = 0
 
+    # 4. Seek past the checkpoint instead of using OFFSET
+    while True:
+        position = models.Q(user_id__gt=checkpoint.last_user_id) | models.Q(
+            user_id=checkpoint.last_user_id, id__gt=checkpoint.last_device_id
+        )
+        chunk = list(devices.filter(position).values_list('id', 'user_id', 'registration_id')[:chunk_size])
+        if not chunk:
+            break
+
+        results = send_to_devices(chunk, title_msg, body_msg)
+        # A user whose devices straddle two chunks was already counted in the previous one
+        new_users = {user_id for _, user_id, _ in chunk} - {checkpoint.last_user_id}
+        users_notified += len(new_users)
+        pushes_sent += len(chunk)
+
+        checkpoint.last_device_id, checkpoint.last_user_id = chunk[-1][0], chunk[-1][1]
+        checkpoint.users_notified = models.F('users_notified') + len(new_users)
+        checkpoint.pushes_sent = models.F('pushes_sent') + len(chunk)
+        checkpoint.save(update_fields=['last_user_id', 'last_device_id', 'users_notified', 'pushes_sent'])
+        checkpoint.refresh_from_db(fields=['users_notified', 'pushes_sent'])
+        print(f"Broadcast of event {event_id}: chunk of {len(chunk)} devices, {list(results.values()).count('sent')} users reached")
+
+    checkpoint.completed_at = timezone.now()
+    checkpoint.save(update_fields=['completed_at'])
+
+    elapsed = max(time.perf_counter() - started, 1e-6)
     print(
-        f"Broadcasted event '{event.name}' notification "
-        f"to {notified_count} users out of {total_users} total."
-    )
\ No newline at end of file
+        f"Broadcasted event '{event.name}' to {users_notified} users ({pushes_sent} devices) in {elapsed:.1f}s: "
+        f"{users_notified / elapsed:.0f} users/sec, {pushes_sent / elapsed:.0f} pushes/sec "
+        f"(totals incl. earlier runs: {checkpoint.users_notified} users, {checkpoint.pushes_sent} pushes)."
+    )
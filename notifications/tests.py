@@ -1,3 +1,367 @@
-from django.test import TestCase
+import datetime
+import threading
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from unittest import mock
+
+from events.models import Event, Registration
+from events.pagination import encode_cursor
+from .chat import notify_chat_message
+from .models import ArchivedNotification, ChatDigest, Notification, NotificationBody, NotificationOutbox, Reminder
+from .outbox import kick_drainer, notify_users
+from .tasks import OUTBOX_CLAIM_SECONDS, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_SECONDS, REMINDER_LABELS, REMINDER_MAX_LATENESS, archive_old_notifications, dispatch_due_reminders, drain_notification_outbox, flush_chat_digests, sweep_event_statuses
+
+CustomUser = get_user_model()
+
+
+class NotificationInboxTests(TestCase):
+    """Inbox pagination and the unread counter kept on the user."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='player', nickname='player')
+        cls.other = CustomUser.objects.create(username='other', nickname='other')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for i in range(25):
+            notify_users([self.user.id, self.other.id], f'title {i}', f'message {i}')
+
+    def unread_count(self):
+        # JWT authentication loads the user per request; force_authenticate would reuse a stale copy
+        self.client.force_authenticate(CustomUser.objects.get(pk=self.user.pk))
+        return self.client.get('/api/notifications/unread_count/').data['unread_count']
+
+    def test_inbox_is_paginated_newest_first(self):
+        first = self.client.get('/api/notifications/')
+        self.assertEqual(len(first.data['results']), 20)
+        self.assertEqual(first.data['results'][0]['title'], 'title 24')
+        second = self.client.get(first.data['next'])
+        self.assertEqual([n['title'] for n in second.data['results']], [f'title {i}' for i in range(4, -1, -1)])
+        self.assertIsNone(second.data['next'])
+
+    def test_counter_follows_creates_and_reads(self):
+        self.assertEqual(self.unread_count(), 25)
+        notification = Notification.objects.filter(user=self.user).first()
+        for _ in range(2):
+            self.client.patch(f'/api/notifications/mark_as_read/{notification.id}/')
+        self.assertEqual(self.unread_count(), 24)
+
+    def test_mark_up_to_cursor(self):
+        page = self.client.get('/api/notifications/?page_size=10')
+        cursor = page.data['next'].split('cursor=')[1].split('&')[0]
+        response = self.client.post('/api/notifications/mark_all_as_read/', {'cursor': cursor}, format='json')
+        self.assertEqual(response.data['marked_as_read'], 10)
+        self.assertEqual(self.unread_count(), 15)
+        self.assertFalse(Notification.objects.filter(user=self.user, body__title='title 14').get().is_read)
+        self.assertTrue(Notification.objects.filter(user=self.user, body__title='title 15').get().is_read)
+
+    def test_malformed_cursor_is_rejected(self):
+        timestamp = Notification.objects.first().timestamp
+        for position in (['garbage', 'x'], [timestamp, 'x'], [timestamp, None]):
+            response = self.client.post('/api/notifications/mark_all_as_read/', {'cursor': encode_cursor(position)}, format='json')
+            self.assertEqual(response.status_code, 400, position)
+        self.assertEqual(self.unread_count(), 25)
+
+    def test_previous_cursor_is_rejected(self):
+        page = self.client.get(self.client.get('/api/notifications/?page_size=10').data['next'])
+        cursor = page.data['previous'].split('cursor=')[1].split('&')[0]
+        response = self.client.post('/api/notifications/mark_all_as_read/', {'cursor': cursor}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.unread_count(), 25)
+
+    def test_mark_all(self):
+        response = self.client.post('/api/notifications/mark_all_as_read/')
+        self.assertEqual(response.data['marked_as_read'], 25)
+        self.assertEqual(self.unread_count(), 0)
+        self.assertEqual(CustomUser.objects.get(pk=self.other.pk).unread_notifications, 25)
+
+
+class NotificationStorageTests(TestCase):
+    """Fan-out shares one body row, and old read notifications leave the inbox table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [CustomUser.objects.create(username=f'player{i}', nickname=f'player{i}') for i in range(5)]
+
+    def test_fan_out_shares_one_body(self):
+        notify_users([user.id for user in self.users], '活動提醒', 'event starts soon', event_id=1)
+        self.assertEqual(NotificationBody.objects.count(), 1)
+        self.assertEqual(Notification.objects.filter(body__message='event starts soon').count(), 5)
+        self.assertEqual(Notification.objects.first().title, '活動提醒')
+
+    def test_archive_moves_only_old_read_notifications(self):
+        notify_users([user.id for user in self.users], 'old', 'old message')
+        notify_users([user.id for user in self.users], 'new', 'new message')
+        Notification.objects.filter(body__title='old').update(timestamp=timezone.now() - datetime.timedelta(days=100))
+        Notification.objects.filter(body__title='old', user__in=self.users[:3]).update(is_read=True)
+        Notification.objects.filter(body__title='new').update(is_read=True)
+        NotificationOutbox.objects.update(state='sent', created_at=timezone.now() - datetime.timedelta(days=100))
+
+        self.assertEqual(archive_old_notifications(days=90, batch_size=2), 3)
+        self.assertEqual(ArchivedNotification.objects.filter(body__title='old').count(), 3)
+        self.assertEqual(Notification.objects.filter(body__title='old').count(), 2)
+        self.assertEqual(Notification.objects.filter(body__title='new').count(), 5)
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+
+class ChatDigestTests(TestCase):
+    """A burst of chat messages costs each recipient one push plus one digest."""
+
+    def test_burst_is_folded_into_one_digest(self):
+        host = CustomUser.objects.create(username='host', nickname='host')
+        sender = CustomUser.objects.create(username='sender', nickname='sender')
+        event = Event.objects.create(
+            name='event', location='court', date=datetime.date(2030, 1, 1), start_time=datetime.time(19),
+            end_time=datetime.time(21), cost=100, spots_left=12, created_by=host, status='open',
+        )
+        Registration.objects.create(event=event, user=sender, number_of_people=1)
+
+        with mock.patch('notifications.chat.schedule_digest_flush') as schedule_flush, \
+                mock.patch('notifications.outbox.kick_drainer'), self.captureOnCommitCallbacks(execute=True):
+            for i in range(5):
+                notify_chat_message(event.id, sender.id, f'message {i}')
+        self.assertEqual(schedule_flush.call_count, 1)
+        self.assertEqual(list(Notification.objects.values_list('body__message', flat=True)), ['message 0'])
+        self.assertEqual(flush_chat_digests(), 0)
+
+        later = timezone.now() + datetime.timedelta(minutes=10)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            self.assertEqual(flush_chat_digests(), 1)
+        self.assertEqual(Notification.objects.filter(user=host).count(), 2)
+        self.assertEqual(Notification.objects.last().message, 'event 有 4 則新訊息')
+        self.assertEqual(ChatDigest.objects.get(user=host).pending_count, 0)
+
+
+class OutboxDrainTests(TestCase):
+    """Delivery states, exponential backoff and giving up in drain_notification_outbox."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create(username='player', nickname='player')
+        notify_users([self.user.id], 'title', 'message')
+        self.entry = NotificationOutbox.objects.get(user=self.user)
+
+    def drain(self, result, at=None):
+        with mock.patch('notifications.tasks.send_notification_to_users', return_value={self.user.id: result}) as send, \
+                mock.patch('django.utils.timezone.now', return_value=at or timezone.now()):
+            drain_notification_outbox()
+        self.entry.refresh_from_db()
+        return send.call_count
+
+    def test_delivered_entry_is_closed(self):
+        self.assertEqual(self.drain('sent'), 1)
+        self.assertEqual((self.entry.state, self.entry.attempts), ('sent', 1))
+        self.assertIsNotNone(self.entry.sent_at)
+        self.assertEqual(self.drain('sent'), 0)
+
+    def test_failed_push_backs_off_exponentially(self):
+        start = timezone.now()
+        self.drain('failed', at=start)
+        self.assertEqual((self.entry.state, self.entry.attempts), ('pending', 1))
+        self.assertEqual(self.entry.next_attempt_at, start + datetime.timedelta(seconds=OUTBOX_RETRY_SECONDS))
+
+        # Not due yet: nothing is sent
+        self.assertEqual(self.drain('failed', at=start + datetime.timedelta(seconds=1)), 0)
+
+        retry_at = self.entry.next_attempt_at
+        self.drain('failed', at=retry_at)
+        self.assertEqual(self.entry.attempts, 2)
+        self.assertEqual(self.entry.next_attempt_at, retry_at + datetime.timedelta(seconds=2 * OUTBOX_RETRY_SECONDS))
+
+    def test_gives_up_after_max_attempts(self):
+        NotificationOutbox.objects.filter(pk=self.entry.pk).update(attempts=OUTBOX_MAX_ATTEMPTS - 1)
+        self.drain('failed')
+        self.assertEqual((self.entry.state, self.entry.attempts), ('failed', OUTBOX_MAX_ATTEMPTS))
+        self.assertEqual(self.drain('sent'), 0)
+
+    def test_entry_is_claimed_before_the_push(self):
+        start = timezone.now()
+
+        def send(user_ids, title, message):
+            entry = NotificationOutbox.objects.get(pk=self.entry.pk)
+            self.assertEqual((entry.state, entry.attempts), ('pending', 1))
+            self.assertEqual(entry.next_attempt_at, start + datetime.timedelta(seconds=OUTBOX_CLAIM_SECONDS))
+            raise ConnectionError
+
+        with mock.patch('notifications.tasks.send_notification_to_users', side_effect=send), \
+                mock.patch('django.utils.timezone.now', return_value=start), self.assertRaises(ConnectionError):
+            drain_notification_outbox()
+
+        # The worker died mid-push: the entry goes out again once the claim has expired
+        self.assertEqual(self.drain('sent', at=start + datetime.timedelta(seconds=OUTBOX_CLAIM_SECONDS - 1)), 0)
+        self.assertEqual(self.drain('sent', at=start + datetime.timedelta(seconds=OUTBOX_CLAIM_SECONDS)), 1)
+        self.assertEqual((self.entry.state, self.entry.attempts), ('sent', 2))
+
+    def test_kick_does_not_retry_the_broker(self):
+        with mock.patch('notifications.tasks.drain_notification_outbox.apply_async', side_effect=ConnectionError) as apply_async:
+            kick_drainer()
+        apply_async.assert_called_once_with(retry=False)
+
+
+class EventStatusSweepTests(TestCase):
+    """sweep_event_statuses moves events to playing / past as their start and end pass."""
+
+    def setUp(self):
+        self.host = CustomUser.objects.create(username='host', nickname='host')
+
+    def create_event(self, status='open', is_overnight=False):
+        return Event.objects.create(
+            name='event', location='court', date=datetime.date(2030, 1, 1), start_time=datetime.time(19),
+            end_time=datetime.time(1) if is_overnight else datetime.time(21), is_overnight=is_overnight,
+            cost=100, spots_left=12, created_by=self.host, status=status,
+        )
+
+    def sweep(self, at):
+        with mock.patch('django.utils.timezone.now', return_value=at):
+            return sweep_event_statuses()
+
+    def statuses(self, *events):
+        return [Event.objects.get(pk=event.pk).status for event in events]
+
+    def test_open_and_waitlist_events_play_then_finish(self):
+        open_event, waitlist_event = self.create_event('open'), self.create_event('waitlist')
+
+        self.assertEqual(self.sweep(open_event.starts_at - datetime.timedelta(seconds=1)), {'playing': 0, 'past': 0})
+        self.assertEqual(self.statuses(open_event, waitlist_event), ['open', 'waitlist'])
+
+        self.assertEqual(self.sweep(open_event.starts_at), {'playing': 2, 'past': 0})
+        self.assertEqual(self.statuses(open_event, waitlist_event), ['playing', 'playing'])
+
+        self.assertEqual(self.sweep(open_event.ends_at), {'playing': 0, 'past': 2})
+        self.assertEqual(self.statuses(open_event, waitlist_event), ['past', 'past'])
+
+    def test_missed_start_goes_straight_to_past(self):
+        event = self.create_event()
+        self.assertEqual(self.sweep(event.ends_at + datetime.timedelta(hours=1)), {'playing': 0, 'past': 1})
+        self.assertEqual(self.statuses(event), ['past'])
+
+    def test_overnight_event_ends_on_the_next_day(self):
+        event = self.create_event(is_overnight=True)
+        self.sweep(event.starts_at + datetime.timedelta(hours=3))
+        self.assertEqual(self.statuses(event), ['playing'])
+        self.sweep(event.starts_at + datetime.timedelta(hours=6))
+        self.assertEqual(self.statuses(event), ['past'])
+
+    def test_canceled_events_are_left_alone(self):
+        event = self.create_event('canceled')
+        self.assertEqual(self.sweep(event.ends_at), {'playing': 0, 'past': 0})
+        self.assertEqual(self.statuses(event), ['canceled'])
+
+    def test_sweep_is_idempotent(self):
+        playing, finished = self.create_event(), self.create_event()
+        Event.objects.filter(pk=finished.pk).update(ends_at=playing.starts_at + datetime.timedelta(minutes=30))
+        at = playing.starts_at + datetime.timedelta(hours=1)
+
+        self.assertEqual(self.sweep(at), {'playing': 1, 'past': 1})
+        self.assertEqual(self.sweep(at), {'playing': 0, 'past': 0})
+        self.assertEqual(self.statuses(playing, finished), ['playing', 'past'])
+
+
+class ReminderDispatchTests(TestCase):
+    """dispatch_due_reminders sends each due reminder once and drops late or canceled ones."""
+
+    def setUp(self):
+        self.host = CustomUser.objects.create(username='host', nickname='host')
+        self.event = Event.objects.create(
+            name='event', location='court', date=datetime.date(2030, 1, 1), start_time=datetime.time(19),
+            end_time=datetime.time(21), cost=100, spots_left=12, created_by=self.host, status='open',
+        )
+        self.reminders = {
+            offset: Reminder.objects.create(event=self.event, offset=offset, due_at=self.event.starts_at - offset)
+            for offset in REMINDER_LABELS
+        }
+
+    def dispatch(self, at, **kwargs):
+        with mock.patch('notifications.tasks.send_event_reminder') as send, \
+                mock.patch('django.utils.timezone.now', return_value=at):
+            counts = dispatch_due_reminders(**kwargs)
+        return counts, [call.args[1] for call in send.call_args_list]
+
+    def states(self):
+        return {reminder.offset: reminder.state for reminder in Reminder.objects.all()}
+
+    def test_due_reminder_is_sent_once(self):
+        hour = datetime.timedelta(hours=1)
+        at = self.event.starts_at - hour + datetime.timedelta(minutes=1)
+        counts, labels = self.dispatch(at)
+        self.assertEqual(counts, {'sent': 1, 'skipped': 1, 'canceled': 0})
+        self.assertEqual(labels, [REMINDER_LABELS[hour]])
+
+        reminder = Reminder.objects.get(pk=self.reminders[hour].pk)
+        self.assertEqual((reminder.state, reminder.sent_at), ('sent', at))
+        self.assertEqual(self.states()[datetime.timedelta(hours=24)], 'skipped')
+        self.assertEqual(self.states()[datetime.timedelta(minutes=30)], 'pending')
+
+        # Already sent: a later run leaves it alone
+        self.assertEqual(self.dispatch(at)[1], [])
+
+    def test_late_reminders_are_skipped(self):
+        # The 30 minute reminder is just past REMINDER_MAX_LATENESS; the start reminder is on time
+        at = self.event.starts_at - datetime.timedelta(minutes=30) + REMINDER_MAX_LATENESS + datetime.timedelta(seconds=1)
+        counts, labels = self.dispatch(at)
+        self.assertEqual(counts, {'sent': 1, 'skipped': 3, 'canceled': 0})
+        self.assertEqual(labels, [REMINDER_LABELS[datetime.timedelta(seconds=0)]])
+        self.assertEqual(self.states()[datetime.timedelta(minutes=30)], 'skipped')
+
+    def test_reminders_of_canceled_events_are_canceled(self):
+        Event.objects.filter(pk=self.event.pk).update(status='canceled')
+        counts, labels = self.dispatch(self.event.starts_at)
+        self.assertEqual(counts, {'sent': 0, 'skipped': 0, 'canceled': 4})
+        self.assertEqual(labels, [])
+        self.assertEqual(set(self.states().values()), {'canceled'})
+
+    def test_all_due_reminders_are_claimed_across_batches(self):
+        at = self.event.starts_at
+        Reminder.objects.update(due_at=at)
+        counts, labels = self.dispatch(at, batch_size=1)
+        self.assertEqual(counts['sent'], 4)
+        self.assertEqual(sorted(labels), sorted(REMINDER_LABELS.values()))
+        self.assertEqual(set(self.states().values()), {'sent'})
+
+
+class ReminderClaimTests(TransactionTestCase):
+    """Reminders another worker has claimed (row locked) are skipped, not sent twice."""
+
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_locked_reminder_is_skipped(self):
+        host = CustomUser.objects.create(username='host', nickname='host')
+        event = Event.objects.create(
+            name='event', location='court', date=datetime.date(2030, 1, 1), start_time=datetime.time(19),
+            end_time=datetime.time(21), cost=100, spots_left=12, created_by=host, status='open',
+        )
+        claimed, free = [
+            Reminder.objects.create(event=event, offset=offset, due_at=event.starts_at)
+            for offset in (datetime.timedelta(hours=1), datetime.timedelta(seconds=0))
+        ]
+
+        locked, release = threading.Event(), threading.Event()
+
+        def other_worker():
+            try:
+                with transaction.atomic():
+                    Reminder.objects.select_for_update().get(pk=claimed.pk)
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        worker = threading.Thread(target=other_worker)
+        worker.start()
+        self.assertTrue(locked.wait(10))
+        try:
+            with mock.patch('notifications.tasks.send_event_reminder') as send, \
+                    mock.patch('django.utils.timezone.now', return_value=event.starts_at):
+                counts = dispatch_due_reminders()
+        finally:
+            release.set()
+            worker.join()
+
+        self.assertEqual((counts['sent'], send.call_count), (1, 1))
+        self.assertEqual(Reminder.objects.get(pk=claimed.pk).state, 'pending')
+        self.assertEqual(Reminder.objects.get(pk=free.pk).state, 'sent')
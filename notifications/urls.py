@@ -1,10 +1,12 @@
 # notifications/urls.py
 from django.urls import path
-from .views import NotificationListView, MarkNotificationAsReadAPIView, RegisterDeviceTokenView
+from .views import NotificationListView, MarkNotificationAsReadAPIView, MarkAllNotificationsAsReadAPIView, UnreadNotificationCountView, RegisterDeviceTokenView
 
 urlpatterns = [
     path('notifications/', NotificationListView.as_view(), name='notifications'),
     path('notifications/mark_as_read/<int:pk>/', MarkNotificationAsReadAPIView.as_view(), name='mark-notification-as-read'),
+    path('notifications/mark_all_as_read/', MarkAllNotificationsAsReadAPIView.as_view(), name='mark-all-notifications-as-read'),
+    path('notifications/unread_count/', UnreadNotificationCountView.as_view(), name='unread-notification-count'),
     path('register_device_token/', RegisterDeviceTokenView.as_view(), name='register_device_token'),
     #path('send_notification/', SendNotificationView.as_view(), name='send_notification'),
 ]
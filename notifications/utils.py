@@ -1,37 +1,61 @@
 # notifications/utils.py
 from fcm_django.models import FCMDevice
-from firebase_admin.messaging import Message, Notification
-from celery import shared_task
-from django.utils import timezone
-from datetime import timedelta
+from firebase_admin.messaging import Notification
 from firebase_admin import messaging, _messaging_utils
 
+# Firebase accepts at most 500 tokens per multicast request
+FCM_MULTICAST_LIMIT = 500
 
-def send_notification(user, title_msg, body_msg):
-    # Retrieve the FCMDevice for the user
-    devices = FCMDevice.objects.filter(user=user)
 
-    for device in devices:
+def send_to_devices(devices, title_msg, body_msg):
+    """
+    Pushes one message to many devices, one send_each_for_multicast request per 500 tokens.
+    `devices` holds (device id, user id, registration token) tuples. Unregistered tokens
+    are deleted with a single query afterwards.
+    Returns {user_id: 'sent' | 'failed'}; a user counts as sent if any of their devices accepted.
+    """
+    devices = list(devices)
+    results = {}
+    unregistered_device_ids = []
+
+    for start in range(0, len(devices), FCM_MULTICAST_LIMIT):
+        chunk = devices[start:start + FCM_MULTICAST_LIMIT]
+        message = messaging.MulticastMessage(
+            tokens=[token for _, _, token in chunk],
+            notification=Notification(title=title_msg, body=body_msg),
+        )
         try:
-            result = device.send_message(
-                Message(notification=Notification(title=title_msg, body=body_msg))
-            )
-            print(result)
-            return {'status': 'success', 'result': result}
-        except _messaging_utils.UnregisteredError:
-            # Handle unregistered token
-            device.delete()
-            print(f"[ERROR] Unregistered FCM token for user {user.id}, removed from database.")
+            response = messaging.send_each_for_multicast(message)
         except Exception as e:
-            print(f"[ERROR] Could not send notification to user {user.id}: {e}")
-    else:
-        return {'status': 'error', 'message': 'No device found for user'}
-        
-def send_bulk_notification(registrations, event):
-    devices = FCMDevice.objects.filter(user__in=[reg.user for reg in registrations])
-    for device in devices:
-        body_msg = f"活動 {event.name} 的內容已被更改，請重新確認活動時間，地點，要求等"
-        device.send_message(Message(notification=Notification(title="活動資訊更改", body=body_msg)))
+            print(f"[ERROR] Multicast to {len(chunk)} devices failed: {e}")
+            for _, user_id, _ in chunk:
+                results.setdefault(user_id, 'failed')
+            continue
+
+        for (device_id, user_id, _), send_response in zip(chunk, response.responses):
+            if send_response.success:
+                results[user_id] = 'sent'
+                continue
+            results.setdefault(user_id, 'failed')
+            if isinstance(send_response.exception, _messaging_utils.UnregisteredError):
+                unregistered_device_ids.append(device_id)
+
+    if unregistered_device_ids:
+        FCMDevice.objects.filter(id__in=unregistered_device_ids).delete()
+        print(f"[ERROR] Removed {len(unregistered_device_ids)} unregistered FCM tokens from database.")
 
+    return results
 
 
+def send_notification_to_users(user_ids, title_msg, body_msg):
+    """
+    Loads the devices of all `user_ids` in one query and pushes to them in multicast batches.
+    Returns {user_id: 'sent' | 'failed' | 'no_device'} for every requested user.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+    devices = FCMDevice.objects.filter(user_id__in=user_ids, active=True).values_list('id', 'user_id', 'registration_id')
+    results = {user_id: 'no_device' for user_id in user_ids}
+    results.update(send_to_devices(devices, title_msg, body_msg))
+    return results
@@ -14,6 +14,21 @@ from rest_framework import status
 from fcm_django.models import FCMDevice
 from .serializers import FCMDeviceSerializer
 from rest_framework.exceptions import ValidationError
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from events.pagination import coerce_position, decode_cursor, keyset_filter
+from .pagination import NotificationCursorPagination
+
+CustomUser = get_user_model()
+
+
+def decrement_unread_count(user_id, count):
+    if count:
+        CustomUser.objects.filter(pk=user_id).update(
+            unread_notifications=Greatest(F('unread_notifications') - count, 0)
+        )
 
 class RegisterDeviceTokenView(generics.CreateAPIView):
     queryset = FCMDevice.objects.all()
@@ -46,16 +61,59 @@ class MarkNotificationAsReadAPIView(generics.UpdateAPIView):
         instance = self.get_object()
         if instance.user != request.user:
             return Response({'error': 'You do not have permission to mark this notification as read.'}, status=status.HTTP_403_FORBIDDEN)
-        
-        instance.is_read = True
-        instance.save()
+
+        # Conditional UPDATE, so marking the same notification twice only decrements once
+        with transaction.atomic():
+            updated = Notification.objects.filter(pk=instance.pk, is_read=False).update(is_read=True)
+            decrement_unread_count(request.user.pk, updated)
 
         return Response({'success': 'Notification marked as read.'}, status=status.HTTP_200_OK)
 
 
+class MarkAllNotificationsAsReadAPIView(APIView):
+    """
+    Marks every unread notification as read with one UPDATE. With a `next` cursor from the
+    inbox, only the notifications up to and including that position (i.e. the ones the client
+    has loaded) are marked. `previous` cursors do not say how far the client has read and
+    are rejected.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        notifications = Notification.objects.filter(user=request.user, is_read=False)
+
+        token = request.data.get('cursor') or request.query_params.get('cursor')
+        if token:
+            ordering = NotificationCursorPagination.ordering
+            try:
+                position, reverse = decode_cursor(token, ordering)
+                position = coerce_position(Notification, ordering, position)
+            except (ValueError, KeyError, TypeError):
+                return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+            if reverse:
+                return Response({'error': 'Only next cursors can be marked as read'}, status=status.HTTP_400_BAD_REQUEST)
+            timestamp, pk = position
+            notifications = notifications.filter(keyset_filter(ordering, position, reverse=True) | Q(timestamp=timestamp, pk=pk))
+
+        with transaction.atomic():
+            updated = notifications.update(is_read=True)
+            decrement_unread_count(request.user.pk, updated)
+
+        return Response({'marked_as_read': updated}, status=status.HTTP_200_OK)
+
+
+class UnreadNotificationCountView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        # Served from the counter column on the (already loaded) user, no COUNT(*) per poll
+        return Response({'unread_count': request.user.unread_notifications}, status=status.HTTP_200_OK)
+
+
 class NotificationListView(ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = NotificationSerializer
+    pagination_class = NotificationCursorPagination
 
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user).order_by('-timestamp')
+        return Notification.objects.filter(user=self.request.user).select_related('body')
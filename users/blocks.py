@@ -0,0 +1,128 @@
+# users/blocks.py
+import time
+
+import redis
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from volleyball_app.redis_client import get_redis
+from .models import Block
+
+# Cache in front of the Block table, keyed by blocker:
+#  * Redis (when REDIS_URL is configured): one set per blocker, shared by all web/ASGI processes
+#    and kept for BLOCK_CACHE_TTL seconds. Every change bumps a per-blocker generation key; a
+#    reader only writes what it loaded from the database back if the generation did not move
+#    meanwhile (WATCH), so a read racing a block/unblock can never re-cache the old list.
+#  * without REDIS_URL: a per-process dict kept for BLOCK_CACHE_LOCAL_TTL seconds
+#    (single-process setups only, other processes would not see the invalidation).
+# BlockUserView/UnblockUserView call invalidate_blocked_user_ids() after every change.
+LOCAL_TTL = getattr(settings, 'BLOCK_CACHE_LOCAL_TTL', 30)
+LOCAL_MAX_ENTRIES = 10000
+REDIS_TTL = getattr(settings, 'BLOCK_CACHE_TTL', 10 * 60)
+EMPTY_MARKER = '0'  # Redis cannot store an empty set, user ids start at 1
+
+_local_cache = {}  # blocker id -> (expires_at, frozenset of blocked user ids)
+
+
+def _redis_key(blocker_id):
+    return f'blocks:{blocker_id}'
+
+
+def _generation_key(blocker_id):
+    return f'blocks:{blocker_id}:gen'
+
+
+def _load_from_db(blocker_id):
+    return frozenset(Block.objects.filter(blocker_id=blocker_id).values_list('blocked_id', flat=True))
+
+
+def _read_through_redis(client, blocker_id):
+    key = _redis_key(blocker_id)
+    try:
+        members = client.smembers(key)
+        if members:
+            return frozenset(int(member) for member in members if member != EMPTY_MARKER)
+        with client.pipeline() as pipe:
+            pipe.watch(_generation_key(blocker_id))
+            blocked_ids = _load_from_db(blocker_id)
+            pipe.multi()
+            pipe.delete(key)
+            pipe.sadd(key, EMPTY_MARKER, *blocked_ids)
+            pipe.expire(key, REDIS_TTL)
+            try:
+                pipe.execute()
+            except redis.WatchError:
+                pass  # A block/unblock happened meanwhile; the next read loads the new list
+            return blocked_ids
+    except redis.RedisError as e:
+        print(f"[ERROR] Block cache read failed for user {blocker_id}: {e}")
+        return _load_from_db(blocker_id)
+
+
+def get_blocked_user_ids(blocker_id):
+    """Ids of the users `blocker_id` has blocked, as a frozenset."""
+    if blocker_id is None:
+        return frozenset()
+
+    client = get_redis()
+    if client is not None:
+        return _read_through_redis(client, blocker_id)
+
+    now = time.monotonic()
+    cached = _local_cache.get(blocker_id)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    blocked_ids = _load_from_db(blocker_id)
+    if len(_local_cache) >= LOCAL_MAX_ENTRIES:
+        _local_cache.clear()
+    _local_cache[blocker_id] = (now + LOCAL_TTL, blocked_ids)
+    return blocked_ids
+
+
+def is_blocked(blocker_id, blocked_id):
+    return blocked_id in get_blocked_user_ids(blocker_id)
+
+
+def user_group_name(user_id):
+    """Channel layer group that every WebSocket consumer of this user joins."""
+    return f'user_{user_id}'
+
+
+def push_block_change(blocker_id, blocked_id, blocked):
+    """
+    Tells the blocker's open consumers to update their in-memory block set, so they
+    never have to ask the cache or the database while delivering messages.
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(
+            user_group_name(blocker_id),
+            {'type': 'blocks.changed', 'blocked_id': blocked_id, 'blocked': blocked},
+        )
+    except Exception as e:
+        print(f"[ERROR] Block change push failed for user {blocker_id}: {e}")
+
+
+def invalidate_blocked_user_ids(blocker_id):
+    _invalidate(blocker_id)
+    # Once more after commit, in case a read reloaded the old list before the change was visible
+    transaction.on_commit(lambda: _invalidate(blocker_id))
+
+
+def _invalidate(blocker_id):
+    _local_cache.pop(blocker_id, None)
+    client = get_redis()
+    if client is not None:
+        try:
+            pipe = client.pipeline()
+            pipe.incr(_generation_key(blocker_id))
+            pipe.expire(_generation_key(blocker_id), REDIS_TTL)
+            pipe.delete(_redis_key(blocker_id))
+            pipe.execute()
+        except redis.RedisError as e:
+            print(f"[ERROR] Block cache invalidation failed for user {blocker_id}: {e}")
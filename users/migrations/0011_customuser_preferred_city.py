@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-18 20:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_customuser_skill_level'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='preferred_city',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.14 on 2026-10-18 20:31
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread_notifications(apps, schema_editor):
+    CustomUser = apps.get_model('users', 'CustomUser')
+    Notification = apps.get_model('notifications', 'Notification')
+
+    unread = Notification.objects.filter(user=OuterRef('pk'), is_read=False)
+    CustomUser.objects.update(unread_notifications=Coalesce(Subquery(
+        unread.values('user').annotate(total=Count('id')).values('total')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_customuser_preferred_city'),
+        ('notifications', '0019_notificationoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='unread_notifications',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_unread_notifications, migrations.RunPython.noop),
+    ]
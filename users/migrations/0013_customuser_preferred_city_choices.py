@@ -0,0 +1,58 @@
+# Generated by Django 4.2.14 on 2026-10-18 23:10
+
+from django.db import migrations, models
+
+CITY_CHOICES = [
+    ('taipei', '台北市'),
+    ('new_taipei', '新北市'),
+    ('taoyuan', '桃園市'),
+    ('taichung', '臺中市'),
+    ('tainan', '臺南市'),
+    ('kaohsiung', '高雄市'),
+    ('keelung', '基隆市'),
+    ('hsinchu_city', '新竹市'),
+    ('hsinchu_county', '新竹縣'),
+    ('miaoli', '苗栗縣'),
+    ('changhua', '彰化縣'),
+    ('nantou', '南投縣'),
+    ('yunlin', '雲林縣'),
+    ('chiayi_city', '嘉義市'),
+    ('chiayi_county', '嘉義縣'),
+    ('pingtung', '屏東縣'),
+    ('yilan', '宜蘭縣'),
+    ('hualien', '花蓮縣'),
+    ('taitung', '臺東縣'),
+    ('penghu', '澎湖縣'),
+    ('kinmen', '金門縣'),
+    ('lienchiang', '連江縣'),
+    ('unspecified', '未填寫縣市'),
+]
+
+
+def normalize_preferred_city(apps, schema_editor):
+    # Map free-text values onto the city keys the broadcast matches on; drop what cannot be mapped
+    CustomUser = apps.get_model('users', 'CustomUser')
+    cities = {}
+    for key, label in CITY_CHOICES:
+        cities[key] = cities[label] = cities[label.replace('臺', '台')] = cities[label.replace('台', '臺')] = key
+    values = CustomUser.objects.exclude(preferred_city__isnull=True).values_list('preferred_city', flat=True).distinct()
+    for value in list(values):
+        city = cities.get(value.strip()) or cities.get(value.strip().lower())
+        if city != value:
+            CustomUser.objects.filter(preferred_city=value).update(preferred_city=city)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0012_customuser_unread_notifications'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_preferred_city, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='customuser',
+            name='preferred_city',
+            field=models.CharField(blank=True, choices=CITY_CHOICES, max_length=50, null=True),
+        ),
+    ]
@@ -3,6 +3,7 @@ from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.contrib.auth.signals import user_logged_in
 from django.dispatch import receiver
 from django.conf import settings
+from events.models import Event
 
 @receiver(user_logged_in)
 def check_first_login(sender, user, request, **kwargs):
@@ -23,6 +24,21 @@ class CustomUser(AbstractUser):
     gender = models.CharField(max_length=3, choices=GENDER_CHOICES, null=True, blank=True)
     is_first_login = models.BooleanField(default=True)
     skill_level = models.CharField(max_length=100, blank=True, null=True)
+    # Matched exactly against Event.city by the 'city' broadcast audience
+    preferred_city = models.CharField(max_length=50, choices=Event.CITY_CHOICES, blank=True, null=True)
+    # Badge count, only changed with F() updates by the notification code
+    unread_notifications = models.PositiveIntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = ('unread_notifications',)
+
+    def save(self, *args, **kwargs):
+        # Never write a possibly stale in-memory copy of the counter back over the F() updates
+        if not self._state.adding and self.pk and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
 
 class Block(models.Model):
     blocker = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="blocked_users", on_delete=models.CASCADE)
@@ -174,7 +174,7 @@ class UserSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = get_user_model()  # Use the custom user model
-        fields = ['id', 'username', 'gender', 'email', 'first_name', 'last_name', 'nickname', 'position', 'hosted_events', 'registered_events', 'intro', 'skill_level']
+        fields = ['id', 'username', 'gender', 'email', 'first_name', 'last_name', 'nickname', 'position', 'hosted_events', 'registered_events', 'intro', 'skill_level', 'preferred_city']
 
 class ReportSerializer(serializers.ModelSerializer):
     class Meta:
@@ -1,3 +1,39 @@
+from importlib import import_module
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+CustomUser = get_user_model()
+
+
+class PreferredCityTests(TestCase):
+    """preferred_city only holds Event.CITY_CHOICES keys, which the 'city' broadcast matches on."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create(username='player', nickname='player')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_unknown_city_is_rejected(self):
+        for city in ('atlantis', '臺北', 'Taipei'):
+            response = self.client.patch('/users/update-profile/', {'preferred_city': city}, format='json')
+            self.assertEqual(response.status_code, 400, city)
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.preferred_city)
+
+        response = self.client.patch('/users/update-profile/', {'preferred_city': 'taipei'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.preferred_city, 'taipei')
+
+    def test_migration_maps_free_text_onto_city_keys(self):
+        migration = import_module('users.migrations.0013_customuser_preferred_city_choices')
+        values = {'a': ' Taipei ', 'b': '台中市', 'c': 'kaohsiung', 'd': 'atlantis'}
+        for username, city in values.items():
+            CustomUser.objects.create(username=username, preferred_city=city)
 
-# Create your tests here.
+        migration.normalize_preferred_city(apps, None)
+        cities = dict(CustomUser.objects.filter(username__in=values).values_list('username', 'preferred_city'))
+        self.assertEqual(cities, {'a': 'taipei', 'b': 'taichung', 'c': 'kaohsiung', 'd': None})
@@ -12,6 +12,7 @@ from django.contrib.auth import logout, login
 from django.contrib.auth.models import User
 from django.contrib.auth import get_user_model
 from .models import Block
+from .blocks import get_blocked_user_ids, invalidate_blocked_user_ids, push_block_change
 from django.shortcuts import get_object_or_404
 from rest_framework.permissions import AllowAny, IsAuthenticated
 CustomUser = get_user_model()
@@ -152,6 +153,8 @@ class BlockUserView(APIView):
 
             # Create a Block record if not already exists
             Block.objects.get_or_create(blocker=request.user, blocked=blocked_user)
+            invalidate_blocked_user_ids(request.user.id)
+            push_block_change(request.user.id, blocked_user.id, True)
             return Response({"message": "User blocked successfully."}, status=status.HTTP_201_CREATED)
         
         except CustomUser.DoesNotExist:
@@ -166,6 +169,8 @@ class UnblockUserView(APIView):
             block = Block.objects.filter(blocker=request.user, blocked=blocked_user).first()
             if block:
                 block.delete()
+                invalidate_blocked_user_ids(request.user.id)
+                push_block_change(request.user.id, blocked_user.id, False)
                 return Response({"message": "User unblocked successfully."}, status=status.HTTP_200_OK)
             else:
                 return Response({"error": "User is not blocked."}, status=status.HTTP_400_BAD_REQUEST)
@@ -185,7 +190,7 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
 
             # Check if the request user is authenticated and if the target user is blocked
             if request_user.is_authenticated:
-                if Block.objects.filter(blocker=request_user, blocked=user).exists():
+                if user.id in get_blocked_user_ids(request_user.id):
                     user.nickname = "用戶已被封鎖"
                     user.intro = "用戶已被封鎖"
                     return user
@@ -213,7 +218,7 @@ class BlockedUsersListView(generics.ListAPIView):
 
     def get_queryset(self):
         # Get the list of users blocked by the requesting user
-        blocked_user_ids = Block.objects.filter(blocker=self.request.user).values_list('blocked_id', flat=True)
+        blocked_user_ids = get_blocked_user_ids(self.request.user.id)
         return CustomUser.objects.filter(id__in=blocked_user_ids)
 
     def list(self, request, *args, **kwargs):
@@ -3,6 +3,7 @@ from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery
 from celery.schedules import crontab
+from datetime import timedelta
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'volleyball_app.settings')
 
@@ -15,4 +16,37 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
 
-app.conf.broker_url = os.environ.get('CLOUDAMQP_URL')
\ No newline at end of file
+app.conf.broker_url = os.environ.get('CLOUDAMQP_URL')
+
+# Periodic tasks, run by the `beat` process in the Procfile
+app.conf.beat_schedule = {
+    'sweep-event-statuses': {
+        'task': 'notifications.tasks.sweep_event_statuses',
+        'schedule': crontab(),  # every minute
+    },
+    'dispatch-due-reminders': {
+        'task': 'notifications.tasks.dispatch_due_reminders',
+        'schedule': crontab(),
+    },
+    'flush-chat-digests': {
+        'task': 'notifications.tasks.flush_chat_digests',
+        'schedule': crontab(),
+    },
+    'flush-chat-buffer': {
+        'task': 'events.tasks.flush_chat_buffer',
+        'schedule': crontab(),
+    },
+    'sweep-orphan-reminders': {
+        'task': 'notifications.tasks.sweep_orphan_reminders',
+        'schedule': crontab(minute=15),  # hourly
+    },
+    'archive-old-notifications': {
+        'task': 'notifications.tasks.archive_old_notifications',
+        'schedule': crontab(hour=4, minute=0),  # nightly, Asia/Taipei
+    },
+    # Safety net: every commit that writes outbox entries also queues a drain right away
+    'drain-notification-outbox': {
+        'task': 'notifications.tasks.drain_notification_outbox',
+        'schedule': timedelta(seconds=10),
+    },
+}
\ No newline at end of file
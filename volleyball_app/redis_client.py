@@ -0,0 +1,20 @@
+# volleyball_app/redis_client.py
+import redis
+from django.conf import settings
+
+_client = None
+
+
+def get_redis():
+    """
+    Returns a Redis client for the shared caches (the same server as the channel layer),
+    or None when REDIS_URL is not configured. Callers fall back to in-process state then.
+    """
+    global _client
+    url = getattr(settings, 'REDIS_URL', None)
+    if not url:
+        return None
+    if _client is None:
+        options = {'ssl_cert_reqs': None} if url.startswith('rediss://') else {}  # Ignore self-signed certificate validation
+        _client = redis.Redis.from_url(url, decode_responses=True, socket_timeout=1, **options)
+    return _client
@@ -3,4 +3,5 @@ from events import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/events/(?P<event_id>\d+)/chat/$', consumers.ChatConsumer.as_asgi()),
+    re_path(r'ws/live/$', consumers.LiveConsumer.as_asgi()),
 ]
\ No newline at end of file
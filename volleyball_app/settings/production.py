@@ -86,6 +86,9 @@ import os
 import ssl
 import redis
 
+# Also used directly by the block-list cache (see volleyball_app/redis_client.py)
+REDIS_URL = os.environ.get('REDIS_URL')
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -116,6 +119,49 @@ REST_FRAMEWORK = {
     ),
 }
 
+# Seconds a user's block list stays cached in Redis (changes invalidate it at once)
+BLOCK_CACHE_TTL = int(os.environ.get('BLOCK_CACHE_TTL', 10 * 60))
+# Without REDIS_URL: seconds a process keeps its own copy before asking the database again
+BLOCK_CACHE_LOCAL_TTL = int(os.environ.get('BLOCK_CACHE_LOCAL_TTL', 30))
+
+# Default page size of the cursor-paginated event feeds (clients may pass ?page_size=, capped at 100)
+EVENT_FEED_PAGE_SIZE = int(os.environ.get('EVENT_FEED_PAGE_SIZE', 20))
+
+# Push delivery through notifications.NotificationOutbox: entries claimed per batch, and the
+# retry policy for failed pushes (delay doubles after every attempt)
+NOTIFICATION_OUTBOX_BATCH_SIZE = int(os.environ.get('NOTIFICATION_OUTBOX_BATCH_SIZE', 500))
+NOTIFICATION_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('NOTIFICATION_OUTBOX_MAX_ATTEMPTS', 5))
+NOTIFICATION_OUTBOX_RETRY_SECONDS = int(os.environ.get('NOTIFICATION_OUTBOX_RETRY_SECONDS', 30))
+# Seconds a claimed entry stays with its worker before another drain may retry it
+NOTIFICATION_OUTBOX_CLAIM_SECONDS = int(os.environ.get('NOTIFICATION_OUTBOX_CLAIM_SECONDS', 300))
+
+# Chat pushes per recipient and room: the first message notifies at once, later ones within this many
+# seconds are folded into one "N new messages" digest
+CHAT_DIGEST_WINDOW_SECONDS = int(os.environ.get('CHAT_DIGEST_WINDOW_SECONDS', 120))
+
+# Chat messages sent on connect and per "load earlier" page (socket and REST)
+CHAT_HISTORY_PAGE_SIZE = int(os.environ.get('CHAT_HISTORY_PAGE_SIZE', 50))
+
+# Write-behind chat persistence: messages are broadcast at once and written with bulk_create every
+# CHAT_WRITE_BEHIND_INTERVAL_MS or CHAT_WRITE_BEHIND_BATCH messages (see events/chat_buffer.py)
+CHAT_WRITE_BEHIND = os.environ.get('CHAT_WRITE_BEHIND', 'false').lower() == 'true'
+CHAT_WRITE_BEHIND_INTERVAL_MS = int(os.environ.get('CHAT_WRITE_BEHIND_INTERVAL_MS', 300))
+CHAT_WRITE_BEHIND_BATCH = int(os.environ.get('CHAT_WRITE_BEHIND_BATCH', 200))
+
+# Newest messages per room kept in a capped Redis stream for joins and history pages; rooms idle
+# for CHAT_HOT_TTL seconds drop out and are reloaded from the database (see events/chat_history.py)
+CHAT_HOT_MESSAGES = int(os.environ.get('CHAT_HOT_MESSAGES', 200))
+CHAT_HOT_TTL = int(os.environ.get('CHAT_HOT_TTL', 6 * 60 * 60))
+
+# Seconds a chat connection counts as present (no pushes for that room) after its last heartbeat
+CHAT_PRESENCE_TTL = int(os.environ.get('CHAT_PRESENCE_TTL', 90))
+
+# Chat rooms a single ws/live/ socket may be subscribed to at once
+LIVE_MAX_ROOMS = int(os.environ.get('LIVE_MAX_ROOMS', 20))
+
+# Read notifications (and delivered outbox entries) older than this are moved out of the hot tables nightly
+NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', 90))
+
 from datetime import timedelta
 import datetime
 